@@ -0,0 +1,122 @@
+# compares the latency of requests sent with a new connection every time (urllib as SPARQLWrapper did, and a requests
+# session per request as the clients created per page did) and with the shared transport of util/transport.py, against
+# a local stand-in of the api and of the SPARQL endpoint, nothing is fetched from the internet; handshake is a delay in
+# milliseconds added to every new connection, to stand for the TCP and TLS handshakes with a remote host
+#
+#   python -m benchmarks.http_transport [requests] [threads] [handshake]
+import gzip
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from util import transport
+
+CSV = ('item,id\r\n' + ''.join('http://localhost:8181/entity/Q%d,Q%d\r\n' % (i + 1000000, i) for i in range(2000)))
+API = json.dumps({'query': {'recentchanges': [{'type': 'edit', 'title': 'Q%d' % i, 'rcid': i, 'revid': i,
+                                                'timestamp': '2026-01-01T00:00:00Z'} for i in range(500)]}})
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are sent together, as a real server does, small separate writes on a kept alive
+    # connection would wait for the delayed acknowledgement of the client
+    wbufsize = 65536
+    connections = 0
+    handshake = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        time.sleep(Handler.handshake)
+        with Handler.lock:
+            Handler.connections = Handler.connections + 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type):
+        body = body.encode('utf-8')
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = gzip.compress(body, 1)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send(API, 'application/json')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._send(CSV, 'text/csv')
+
+
+def new_connection(url, sparql):
+    if sparql:
+        request = urllib.request.Request(url, data=b'query=select', headers={'Accept': 'text/csv'})
+    else:
+        request = urllib.request.Request(url + '?action=query&list=recentchanges')
+    with urllib.request.urlopen(request) as response:
+        return len(response.read())
+
+
+def new_session(url, sparql):
+    with requests.Session() as session:
+        if sparql:
+            return len(session.post(url, data={'query': 'select'}, headers={'Accept': 'text/csv'}).content)
+        return len(session.get(url, params={'action': 'query', 'list': 'recentchanges'}).content)
+
+
+def shared(url, sparql):
+    if sparql:
+        response = transport.sparql_csv(url, 'select')
+        try:
+            return sum(len(line) for line in transport.text_lines(response))
+        finally:
+            response.close()
+    return len(transport.session().get(url, params={'action': 'query', 'list': 'recentchanges'}).content)
+
+
+def run(function, url, count, threads):
+    def timed(i):
+        start = time.perf_counter()
+        function(url, i % 2 == 0)
+        return time.perf_counter() - start
+
+    Handler.connections = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(timed, range(count)))
+    return time.perf_counter() - start, latencies, Handler.connections
+
+
+def report(name, elapsed, latencies, connections):
+    print(name.ljust(16), "total", round(elapsed, 2), "s  mean", round(statistics.mean(latencies) * 1000, 2),
+          "ms  p50", round(latencies[len(latencies) // 2] * 1000, 2),
+          "ms  p95", round(latencies[int(len(latencies) * 0.95)] * 1000, 2), "ms  connections", connections)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    Handler.handshake = (float(sys.argv[3]) if len(sys.argv) > 3 else 0) / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+    print("requests", count, " threads", threads, " handshake", Handler.handshake * 1000, "ms")
+    report("urllib", *run(new_connection, url, count, threads))
+    report("session per call", *run(new_session, url, count, threads))
+    report("shared transport", *run(shared, url, count, threads))
+    server.shutdown()
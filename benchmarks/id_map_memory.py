@@ -0,0 +1,44 @@
+# compares the memory and the lookup time of the dict and the compact backends of the IdSparql maps
+#
+#   python -m benchmarks.id_map_memory [number of entries]
+import random
+import sys
+import time
+import tracemalloc
+
+from util.compact_id_map import CompactIdMap
+
+
+def pairs(n):
+    random.seed(42)
+    for i in random.sample(range(1, 120000000), n):
+        yield 'Q' + str(i), 'Q' + str(random.randint(1, 10000000))
+
+
+def measure(name, create, n):
+    # the memory is measured on a second load, tracing the allocations slows the load down
+    start = time.time()
+    mapping = create()
+    mapping.update(pairs(n))
+    load_time = time.time() - start
+    del mapping
+    tracemalloc.start()
+    mapping = create()
+    mapping.update(pairs(n))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    ids = ['Q' + str(random.randint(1, 120000000)) for i in range(100000)]
+    start = time.time()
+    for id in ids:
+        if id in mapping:
+            mapping[id]
+    lookup_time = time.time() - start
+    print(name.ljust(8), str(n).rjust(10), "entries", str(round(memory / 1024 / 1024, 1)).rjust(8), "MB",
+          str(round(memory / n, 1)).rjust(7), "bytes/entry", " load", round(load_time, 2), "s",
+          " 100000 lookups", round(lookup_time, 3), "s")
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    measure('dict', dict, n)
+    measure('compact', lambda: CompactIdMap('Q'), n)
@@ -0,0 +1,84 @@
+# compares the cpu time and the memory needed to diff an entity on pywikibot pages (the current path) and on the raw
+# json (JsonDiff); both entities are fetched first, nothing is written
+#
+#   python -m benchmarks.json_diff Q64 Q90 ...
+#
+# the page path builds the ItemPage of both sides and matches the claims through toJSON() like claims_to_remove and
+# claims_to_add do, the json path computes the whole wbeditentity data; the translations that need pywikibot and the
+# edit history are left out of both. It needs the wikibase and wikidata sites of user-config.py and the id mapping, the
+# connection is only made when it is run; without access to them it cannot run and no numbers are given here
+import copy
+import sys
+import time
+import tracemalloc
+
+import pywikibot
+
+from util.json_diff import JsonDiff
+from util.util import WikibaseImporter, languages
+
+# set when the benchmark is run
+wikibase_repo = None
+wikidata_repo = None
+wikibase_importer = None
+# without the support entities, the globes are not synchronized
+json_diff = None
+
+
+def fetch(repo, id):
+    return repo.simple_request(action='wbgetentities', ids=id).submit()['entities'][id]
+
+
+def page(repo, json_object):
+    item = pywikibot.ItemPage(repo, json_object['id'])
+    item._content = copy.deepcopy(json_object)
+    item.get()
+    return item
+
+
+def page_path(wikidata_json, wikibase_json):
+    wikidata_item = page(wikidata_repo, wikidata_json)
+    wikibase_item = page(wikibase_repo, wikibase_json)
+    wikidata_claims = [c.toJSON() for claims in wikidata_item.claims for c in wikidata_item.claims.get(claims)]
+    wikibase_claims = [c.toJSON() for claims in wikibase_item.claims for c in wikibase_item.claims.get(claims)]
+    removals = json_diff.removals(wikidata_claims, wikibase_claims)
+    # claims_to_add works on the refetched entity and calls toJSON() again
+    wikidata_claims = [c.toJSON() for claims in wikidata_item.claims for c in wikidata_item.claims.get(claims)]
+    wikibase_claims = [c.toJSON() for claims in wikibase_item.claims for c in wikibase_item.claims.get(claims)]
+    return removals, json_diff.missing(wikidata_claims, wikibase_claims)
+
+
+def json_path(wikidata_json, wikibase_json):
+    return json_diff.diff(wikidata_json, wikibase_json)
+
+
+def measure(function, wikidata_json, wikibase_json, repeat=5):
+    start = time.process_time()
+    for i in range(repeat):
+        function(wikidata_json, wikibase_json)
+    cpu = (time.process_time() - start) / repeat
+    tracemalloc.start()
+    function(wikidata_json, wikibase_json)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak
+
+
+if __name__ == '__main__':
+    wikibase_repo = pywikibot.Site("my", "my").data_repository()
+    wikidata_repo = pywikibot.Site("wikidata", "wikidata").data_repository()
+    wikibase_importer = WikibaseImporter(wikibase_repo, wikidata_repo)
+    json_diff = JsonDiff(wikibase_importer.id, languages, wikibase_importer.identifier.itemIdentifier,
+                         wikibase_repo.concept_base_uri, wikibase_importer.properties,
+                         wikibase_importer.identifier.propertyIdentifier)
+    for id in sys.argv[1:]:
+        if not wikibase_importer.id.contains_id(id):
+            print(id, "is not imported")
+            continue
+        wikidata_json = fetch(wikidata_repo, id)
+        wikibase_json = fetch(wikibase_repo, wikibase_importer.id.get_id(id))
+        claims = sum(len(c) for c in wikidata_json.get('claims', {}).values())
+        for name, function in (('pages', page_path), ('json', json_path)):
+            cpu, peak = measure(function, wikidata_json, wikibase_json)
+            print(id.ljust(10), str(claims).rjust(6), "claims", name.ljust(6), str(round(cpu * 1000, 1)).rjust(8), "ms",
+                  str(round(peak / 1024 / 1024, 1)).rjust(7), "MB peak")
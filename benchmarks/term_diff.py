@@ -0,0 +1,83 @@
+# compares the term diff on the raw json (TermDiff) with the diff of the importer on pywikibot pages (diff_terms)
+#
+#   python -m benchmarks.term_diff [number of entities]
+import random
+import sys
+import time
+
+from util.term_diff import TermDiff
+from util.util import diff_terms, languages
+
+try:
+    from pywikibot.page._collections import LanguageDict, AliasesDict
+except ImportError:
+    LanguageDict = AliasesDict = None
+
+# about the number of languages of a well known Wikidata item
+ALL_LANGUAGES = languages + ['l' + str(i) for i in range(300 - len(languages))]
+
+
+def entity(i):
+    random.seed(i)
+    json_object = {'labels': {}, 'descriptions': {}, 'aliases': {}}
+    for language in ALL_LANGUAGES:
+        json_object['labels'][language] = {'language': language, 'value': 'label ' + str(random.randint(0, 1000))}
+        json_object['descriptions'][language] = {'language': language, 'value': 'description ' + language}
+        json_object['aliases'][language] = [{'language': language, 'value': 'alias ' + str(j)} for j in
+                                            range(random.randint(0, 3))]
+    return json_object
+
+
+# a wikibase entity with the languages to synchronize, some terms changed in wikidata since then
+def synced(json_object):
+    copy = {'labels': {}, 'descriptions': {}, 'aliases': {}}
+    for term in copy:
+        for language in languages:
+            copy[term][language] = json_object[term][language]
+    for language in random.sample(languages, 5):
+        copy['labels'][language] = {'language': language, 'value': 'old label'}
+    return copy
+
+
+# the terms of a json as a page would have them after get()
+class Page:
+    def __init__(self, json_object):
+        if LanguageDict is not None:
+            self.labels = LanguageDict.fromJSON(json_object['labels'])
+            self.descriptions = LanguageDict.fromJSON(json_object['descriptions'])
+            self.aliases = AliasesDict.fromJSON(json_object['aliases'])
+        else:
+            self.labels = dict((k, v['value']) for k, v in json_object['labels'].items())
+            self.descriptions = dict((k, v['value']) for k, v in json_object['descriptions'].items())
+            self.aliases = dict((k, [a['value'] for a in v]) for k, v in json_object['aliases'].items())
+
+
+def per_entity(pages):
+    diffs = []
+    for wikidata_page, wikibase_page in pages:
+        diff = {}
+        for term in ('labels', 'descriptions', 'aliases'):
+            changed = diff_terms(getattr(wikidata_page, term), getattr(wikibase_page, term), True)
+            if len(changed) > 0:
+                diff[term] = dict(changed)
+        diffs.append(diff)
+    return diffs
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    pairs = []
+    for i in range(n):
+        json_object = entity(i)
+        pairs.append((json_object, synced(json_object)))
+    start = time.time()
+    pages = [(Page(wikidata_json), Page(wikibase_json)) for wikidata_json, wikibase_json in pairs]
+    pages_time = time.time() - start
+    start = time.time()
+    expected = per_entity(pages)
+    per_entity_time = time.time() - start
+    start = time.time()
+    diffs = TermDiff(languages).diff_pairs(pairs)
+    batch_time = time.time() - start
+    print("entities", n, " pages", round(pages_time, 2), "s  per entity on pages", round(per_entity_time, 2),
+          "s  on json", round(batch_time, 2), "s  same result", diffs == expected)
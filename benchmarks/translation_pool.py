@@ -0,0 +1,90 @@
+# compares the time to diff large entities with JsonDiff in the sync threads and in the translation processes, on
+# generated entities and a generated id mapping, nothing is fetched
+#
+#   python -m benchmarks.translation_pool [number of entities] [claims per entity] [processes]
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from util.IdSparql import IdSparql
+from util.json_diff import JsonDiff
+from util.property_metadata import PropertyMetadata
+from util.translation_pool import TranslationPool
+from util.util import languages
+
+BASE = "http://localhost:8181/entity/"
+
+
+def mapping(n):
+    id_map = IdSparql(None, 'P1', 'P2')
+    id_map.mapEntity = dict(('Q' + str(i), 'Q' + str(i + 1000000)) for i in range(1, n))
+    id_map.mapProperty = dict(('P' + str(i), 'P' + str(i + 1000)) for i in range(1, 2000))
+    return id_map
+
+
+def item_value(i):
+    return {'value': {'entity-type': 'item', 'numeric-id': i, 'id': 'Q' + str(i)}, 'type': 'wikibase-entityid'}
+
+
+def claim(id_map, random_generator, wikibase):
+    property = random_generator.randint(3, 1999)
+    value = random_generator.randint(1, 99999)
+    if wikibase:
+        property = int(id_map.get_id('P' + str(property))[1:])
+        value = int(id_map.get_id('Q' + str(value))[1:])
+    reference_property = 'P' + str(1003 if wikibase else 3)
+    return {'mainsnak': {'snaktype': 'value', 'property': 'P' + str(property), 'datatype': 'wikibase-item',
+                         'datavalue': item_value(value)}, 'type': 'statement', 'rank': 'normal',
+            'references': [{'snaks': {reference_property: [
+                {'snaktype': 'value', 'property': reference_property, 'datatype': 'string',
+                 'datavalue': {'value': 'source ' + str(value), 'type': 'string'}}]}}]}
+
+
+# a wikidata entity and the wikibase entity synced from it, some claims changed since
+def entity(id_map, i, claims):
+    random_generator = random.Random(i)
+    wikidata_claims = {}
+    wikibase_claims = {}
+    for j in range(claims):
+        state = random_generator.getstate()
+        wikidata_claim = claim(id_map, random_generator, False)
+        wikidata_claims.setdefault(wikidata_claim['mainsnak']['property'], []).append(wikidata_claim)
+        if j % 20 != 0:
+            random_generator.setstate(state)
+            wikibase_claim = claim(id_map, random_generator, True)
+            wikibase_claim['id'] = 'Q' + str(i) + '$' + str(j)
+            wikibase_claims.setdefault(wikibase_claim['mainsnak']['property'], []).append(wikibase_claim)
+    return ({'type': 'item', 'id': 'Q' + str(i), 'claims': wikidata_claims},
+            {'type': 'item', 'id': id_map.get_id('Q' + str(i)), 'claims': wikibase_claims})
+
+
+# the elapsed time, and the cpu time of this process, i.e. of the sync threads that share the GIL
+def run(function, pairs, workers):
+    start = time.time()
+    cpu = time.process_time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda pair: function(pair[0], pair[1]), pairs))
+    return time.time() - start, time.process_time() - cpu, results
+
+
+def summary(results):
+    return [(len(data.get('claims', [])), len(removals), len(unresolved)) for data, removals, unresolved in results]
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    claims = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    id_map = mapping(100000)
+    pairs = [entity(id_map, i, claims) for i in range(1, n + 1)]
+    json_diff = JsonDiff(id_map, languages, 'P1', BASE, None, 'P2')
+    threads_time, threads_cpu, expected = run(json_diff.diff, pairs, processes)
+    pool = TranslationPool(id_map, PropertyMetadata(), languages, 'P1', 'P2', BASE, processes)
+    pool_time, pool_cpu, results = run(pool.diff, pairs, processes)
+    pool.close()
+    print("entities", n, " claims", claims, " cores", os.cpu_count())
+    print("threads  ", processes, round(threads_time, 2), "s elapsed", round(threads_cpu, 2), "s cpu in the sync process")
+    print("processes", processes, round(pool_time, 2), "s elapsed", round(pool_cpu, 2), "s cpu in the sync process")
+    print("same result", summary(results) == summary(expected))
@@ -1,9 +1,7 @@
 #configuration for pywikibot
 import os
-import time
 
 import pywikibot
-from SPARQLWrapper import SPARQLWrapper, JSON
 from pywikibot import config2
 import configparser
 app_config = configparser.ConfigParser()
@@ -30,9 +28,11 @@ wikidata_repo = wikidata.data_repository()
 
 #import an item
 from util.util import WikibaseImporter
+from util.sync_pool import SyncPool
+from util.import_planner import ImportPlanner
+from util.transport import edit_report, sparql_select
 wikibase_importer = WikibaseImporter(wikibase_repo,wikidata_repo)
-
-sparql = SPARQLWrapper(app_config.get('wikibase', 'sparqlEndPoint'))
+wikibase_importer.presync_support()
 
 query = """
            # select distinct ?id where {
@@ -49,28 +49,20 @@ query = """
  }  group by ?s1 having(count(?prop) = 1)}}
 
         """
-sparql.setQuery(query)
-sparql.setReturnFormat(JSON)
-results = sparql.query().convert()
-count = 1
-for result in results['results']['bindings']:
-    print(count,"/",len(results['results']['bindings']))
-    count=count+1
+results = sparql_select(app_config.get('wikibase', 'sparqlEndPoint'), query)
+
+
+def sync(result):
     split = result['id']['value'].split('/')
     id = split[len(split)-1]
     print("Changing ",id)
-    wikidata_item = pywikibot.ItemPage(wikidata_repo, id)
     try:
-        wikidata_item.get()
+        wikidata_item = wikibase_importer.fetcher.get(id)
         wikibase_importer.change_item(wikidata_item, wikibase_repo, True)
     except pywikibot.exceptions.IsRedirectPage as e:
         print("THIS IS A REDIRECT PAGE "+id)
-        time.sleep(5)
-        sparql = SPARQLWrapper("https://query.wikidata.org/sparql")
         query = "select ?id where { <http://www.wikidata.org/entity/"+id+"> <http://www.w3.org/2002/07/owl#sameAs> ?id . }"
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        new_results = sparql.query().convert()
+        new_results = sparql_select("https://query.wikidata.org/sparql", query)
         for new_result in new_results['results']['bindings']:
             newId = new_result['id']['value'].replace("http://www.wikidata.org/entity/","")
             print("SEARCHING THE NEW ID ",newId)
@@ -81,3 +73,26 @@ for result in results['results']['bindings']:
             except pywikibot.exceptions.IsRedirectPage as e:
                 print("THIS SHOULD NOT HAPPEN")
 
+
+pool = SyncPool(wikibase_importer, wikidata_repo, wikibase_repo, app_config.getint('sync', 'workers', fallback=1))
+planner = ImportPlanner(wikibase_importer, pool)
+batch_size = app_config.getint('sync', 'batch', fallback=500)
+bindings = results['results']['bindings']
+count = 1
+for i in range(0, len(bindings), batch_size):
+    batch = bindings[i:i + batch_size]
+    # only the entities that changed in wikidata since their last sync are synced
+    changed = set(wikibase_importer.changed_ids([result['id']['value'].split('/')[-1] for result in batch]))
+    count = count + len(batch)
+    batch = [result for result in batch if result['id']['value'].split('/')[-1] in changed]
+    print(count - 1, "/", len(bindings), ",", len(batch), "changed")
+    # fetch the entities of the batch from wikidata with few requests
+    wikibase_importer.prefetch([result['id']['value'].split('/')[-1] for result in batch])
+    # the entities the batch refers to are created first, in parallel
+    planner.prepare([result['id']['value'].split('/')[-1] for result in batch])
+    for result in batch:
+        pool.submit(lambda result=result: sync(result))
+    pool.join()
+    wikibase_importer.fetcher.clear()
+    print(edit_report())
+pool.shutdown()
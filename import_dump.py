@@ -0,0 +1,166 @@
+#configuration for pywikibot
+import argparse
+import os
+
+import pywikibot
+from pywikibot import config2
+import configparser
+app_config = configparser.ConfigParser()
+app_config.read('config/application.config.ini')
+
+"""
+IMPORTS ENTITIES FROM A WIKIDATA JSON DUMP INSTEAD OF FETCHING THEM ONE BY ONE FROM THE API
+python import_dump.py filter latest-all.json.bz2 subset.json.gz --ids list      writes the entities of the list to a small dump
+python import_dump.py load subset.json.gz [selected.json.gz]                    imports the entities of a dump with the api
+python import_dump.py translate subset.json.gz wikibase.json.gz                 writes the entities translated for the wikibase
+--ids takes a file with one id per line, --predicate module:function a function that tells from the entity json if
+the entity is wanted; both can be given to load directly from the full dump
+"""
+
+parser = argparse.ArgumentParser()
+parser.add_argument('command', choices=['filter', 'load', 'translate'])
+parser.add_argument('dump')
+parser.add_argument('output', nargs='?')
+parser.add_argument('--ids')
+parser.add_argument('--predicate')
+parser.add_argument('--processes', type=int)
+args = parser.parse_args()
+
+from util.dump_reader import dump_entities, read_ids, write_dump
+
+ids = read_ids(args.ids) if args.ids else None
+
+
+def entities():
+    return dump_entities(args.dump, ids=ids, predicate=args.predicate, processes=args.processes)
+
+
+if args.command == 'filter':
+    count = write_dump(args.output, entities())
+    print("Wrote", count, "entities to", args.output)
+    raise SystemExit
+
+family = 'my'
+mylang = 'my'
+familyfile=os.path.relpath("./config/my_family.py")
+if not os.path.isfile(familyfile):
+  print ("family file %s is missing" % (familyfile))
+config2.register_family_file(family, familyfile)
+config2.password_file = "user-password.py"
+config2.usernames['my']['my'] = app_config.get('wikibase', 'user')
+
+#connect to the wikibase
+wikibase = pywikibot.Site("my", "my")
+wikibase_repo = wikibase.data_repository()
+wikibase_repo.login()
+
+if args.command == 'translate':
+    # nothing is written to the wikibase, the entities are translated with the id mapping only: the entities of the
+    # dump that are imported already keep their wikibase id, the others have none; the claims whose values are not
+    # imported yet are left out and the ids they refer to are written to <output>.missing, to be imported first (e.g.
+    # with the load command or import_list.py) before translating again
+    from util.IdSparql import IdSparql
+    from util.PropertyWikidataIdentifier import PropertyWikidataIdentifier
+    from util.property_metadata import PropertyMetadata
+    from util.json_diff import JsonDiff
+    from util.entity_fetcher import referenced_ids
+    from util.util import languages
+
+    identifier = PropertyWikidataIdentifier()
+    identifier.get(wikibase_repo)
+    id_map = IdSparql(app_config.get('wikibase', 'sparqlEndPoint'), identifier.itemIdentifier,
+                      identifier.propertyIdentifier)
+    id_map.load()
+    json_diff = JsonDiff(id_map, languages, identifier.itemIdentifier, wikibase_repo.concept_base_uri,
+                         PropertyMetadata(app_config.get('mapping', 'properties', fallback='')),
+                         identifier.propertyIdentifier)
+    missing = set()
+    left_out = [0]
+
+    def translated():
+        for entity in entities():
+            wikibase_entity, unresolved = json_diff.translate_entity(entity)
+            if len(unresolved) > 0:
+                left_out[0] = left_out[0] + len(unresolved)
+                missing.update(id for id in referenced_ids({'claims': {'': unresolved}}) if not id_map.contains_id(id))
+            yield wikibase_entity
+
+    count = write_dump(args.output, translated())
+    with open(args.output + '.missing', 'w') as fp:
+        for id in sorted(missing, key=lambda id: (id[0], int(id[1:]))):
+            fp.write(id + '\n')
+    print("Wrote", count, "entities to", args.output + ",", left_out[0], "claims left out,", len(missing),
+          "entities to import first in", args.output + '.missing')
+    raise SystemExit
+
+#connect to wikidata, only for the entities the dump entities refer to and that are not in the dump
+wikidata = pywikibot.Site("wikidata", "wikidata")
+wikidata_repo = wikidata.data_repository()
+
+from util.util import WikibaseImporter
+from util.sync_pool import SyncPool
+from util.import_planner import ImportPlanner
+from util.transport import edit_report
+
+wikibase_importer = WikibaseImporter(wikibase_repo, wikidata_repo)
+wikibase_importer.presync_support()
+pool = SyncPool(wikibase_importer, wikidata_repo, wikibase_repo, app_config.getint('sync', 'workers', fallback=1))
+planner = ImportPlanner(wikibase_importer, pool)
+batch_size = app_config.getint('sync', 'batch', fallback=500)
+
+
+def batches(entities):
+    batch = []
+    for entity in entities:
+        batch.append(entity)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+# first pass: every entity of the dump is created with its terms, so that the claims of the second pass find all the
+# entities they refer to, also the ones that come later in the dump; the selected entities are kept in a small local
+# dump on the way, so that the large dump is read only once
+def created(entities):
+    count = 0
+    for batch in batches(entities):
+        for entity in batch:
+            page = wikibase_importer.fetcher.add_json(entity)
+            if entity['id'].startswith("P"):
+                pool.submit(lambda page=page: wikibase_importer.importProperty(page))
+            else:
+                pool.submit(lambda page=page: wikibase_importer.importItem(page))
+        pool.join()
+        wikibase_importer.fetcher.clear()
+        count = count + len(batch)
+        print("Created", count, "entities")
+        print(edit_report())
+        for entity in batch:
+            yield entity
+
+
+# the selected entities are kept in the output if one is given
+spool = args.output or args.dump + '.selected.json.gz'
+write_dump(spool, created(entities()))
+
+# second pass: the statements, read from the selected entities
+count = 0
+for batch in batches(dump_entities(spool, processes=args.processes)):
+    for entity in batch:
+        wikibase_importer.fetcher.add_json(entity)
+    batch = [entity['id'] for entity in batch]
+    # only the entities that are not in the dump are fetched from wikidata
+    wikibase_importer.prefetch(batch)
+    planner.prepare(batch)
+    for id in batch:
+        pool.submit(id)
+    pool.join()
+    wikibase_importer.fetcher.clear()
+    count = count + len(batch)
+    print("Synchronized", count, "entities")
+    print(edit_report())
+pool.shutdown()
+if args.output is None:
+    os.remove(spool)
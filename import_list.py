@@ -11,29 +11,44 @@ wikidata = pywikibot.Site("wikidata", "wikidata")
 wikidata_repo = wikidata.data_repository()
 
 from util.util import WikibaseImporter
+from util.sync_pool import SyncPool
+from util.import_planner import ImportPlanner
+import configparser
+app_config = configparser.ConfigParser()
+app_config.read('config/application.config.ini')
+
 wikibase_importer = WikibaseImporter(wikibase_repo,wikidata_repo)
+wikibase_importer.presync_support()
+pool = SyncPool(wikibase_importer, wikidata_repo, wikibase_repo, app_config.getint('sync', 'workers', fallback=1))
+planner = ImportPlanner(wikibase_importer, pool)
+
+# import a list, the entities are fetched from wikidata in batches
+batch_size = app_config.getint('sync', 'batch', fallback=500)
+
+
+def import_batch(batch):
+    wikibase_importer.prefetch(batch)
+    # the entities the batch refers to are created first, in parallel
+    planner.prepare(batch)
+    for id in batch:
+        pool.submit(id)
+    pool.join()
+    wikibase_importer.fetcher.clear()
+    print(edit_report())
+
 
-# import a list
 filepath = 'list2'
+batch = []
 with open(filepath) as fp:
     line = fp.readline()
     while line:
         print("Importing " + line.replace("\n", ""))
         if not line.startswith("#"):
-            if (line.startswith("Q")):
-                wikidata_item = pywikibot.ItemPage(wikidata_repo, line)
-                wikidata_item.get()
-                wikibase_importer.change_item(wikidata_item, wikibase_repo, True)
-            elif (line.startswith("P")):
-                wikidata_property = pywikibot.PropertyPage(wikidata_repo, line)
-                wikidata_property.get()
-                wikibase_importer.change_property(wikidata_property, wikibase_repo, True)
+            if (line.startswith("Q")) or (line.startswith("P")):
+                batch.append(line.strip())
+                if len(batch) == batch_size:
+                    import_batch(batch)
+                    batch = []
         line = fp.readline()
-
-
-
-
-
-
-
-
+import_batch(batch)
+pool.shutdown()
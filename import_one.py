@@ -19,13 +19,13 @@ wikibase_importer = WikibaseImporter(wikibase_repo,wikidata_repo)
 #import a single item or property
 arg = sys.argv[1]
 print(f"Importing {arg}")
+# fetch the entity together with the entities it refers to
+wikibase_importer.prefetch([arg])
 if arg.startswith("Q"):
     print("before get")
-    wikidata_item = pywikibot.ItemPage(wikidata_repo, arg)
-    wikidata_item.get()
+    wikidata_item = wikibase_importer.fetcher.get(arg)
     print("after get")
     wikibase_importer.change_item(wikidata_item, wikibase_repo, True)
 elif arg.startswith("P"):
-    wikidata_property = pywikibot.PropertyPage(wikidata_repo, arg)
-    wikidata_property.get()
+    wikidata_property = wikibase_importer.fetcher.get(arg)
     wikibase_importer.change_property(wikidata_property, wikibase_repo, True)
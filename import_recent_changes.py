@@ -5,12 +5,12 @@ from pywikibot import config2
 
 import logging
 
-from util.get_wikidata_changes import get_wikidata_changes
+from util.changes import RecentChangesFeed
+from util.change_sync import ChangeCounters, ChangeSync, mapped_entities
+from util.sync_pool import SyncPool
 
 logging.getLogger('pywiki').disabled
 
-from util.IdSparql import IdSparql
-from util.PropertyWikidataIdentifier import PropertyWikidataIdentifier
 import configparser
 app_config = configparser.ConfigParser()
 app_config.read('config/application.config.ini')
@@ -35,31 +35,24 @@ wikidata = pywikibot.Site("wikidata", "wikidata")
 wikidata_repo = wikidata.data_repository()
 wikibase_repo.login()
 
-from util.util import changeItem
-
-identifier = PropertyWikidataIdentifier()
-identifier.get(wikibase_repo)
-print('Wikidata Item Identifier',identifier.itemIdentifier)
-
-idSparql = IdSparql(app_config.get('wikibase', 'sparqlEndPoint'), identifier.itemIdentifier, identifier.propertyIdentifier)
-idSparql.load()
-
-#grab all entities that changed
-recent = get_wikidata_changes(None, 15)
-for rc in recent:
-    print(str(rc['title']))
-    if idSparql.contains_id(str(rc['title'])):
-        print("This entity ...", idSparql.get_id(str(rc['title']))," corresponding to Wikidata entity "+str(rc['title'])+" has changed and will be sync!")
-        wikidata_item = pywikibot.ItemPage(wikidata_repo, str(rc['title']))
-        #check if the entity has some statements
-        wikibase_item = pywikibot.ItemPage(wikibase_repo, idSparql.get_id(str(rc['title'])))
-        wikibase_item.get()
-        count = 0
-        for wikibase_claims in wikibase_item.claims:
-            for wikibase_c in wikibase_item.claims.get(wikibase_claims):
-                count=count+1
-        if count > 1:
-            changeItem(wikidata_item, wikibase_repo, True)
-        else:
-            print("Change only the labels")
-            changeItem(wikidata_item, wikibase_repo, False)
+from util.util import WikibaseImporter
+wikibase_importer = WikibaseImporter(wikibase_repo, wikidata_repo)
+wikibase_importer.presync_support()
+print('Wikidata Item Identifier',wikibase_importer.identifier.itemIdentifier)
+idSparql = wikibase_importer.id
+
+#grab all entities that changed since the previous run, the first run looks 15 minutes back
+feed = RecentChangesFeed('wikidata', 15)
+counters = ChangeCounters()
+mapped = mapped_entities(feed.changes(), idSparql, counters)
+# the entities that could not be synced by the previous run are synced again
+seen = set(mapped)
+retried = [id for id in idSparql.filter_mapped(feed.failed()) if id not in seen]
+mapped = mapped + retried
+print(counters.report(), ", synced again", len(retried))
+pool = SyncPool(wikibase_importer, wikidata_repo, wikibase_repo, app_config.getint('sync', 'workers', fallback=1))
+change_sync = ChangeSync(wikibase_importer, wikibase_repo, pool, app_config.getint('sync', 'batch', fallback=500))
+change_sync.sync(mapped, counters)
+pool.shutdown()
+print(counters.report())
+feed.save(failed=change_sync.failed)
@@ -1,26 +1,141 @@
 # coding=utf-8
 import configparser
 import json
+import queue
+import re
 import sys
+import threading
 import time
 import traceback
-from datetime import timedelta
+from collections import OrderedDict
+from datetime import datetime, timezone
 
 import pywikibot
-from SPARQLWrapper import SPARQLWrapper
 
 from util.PropertyWikidataIdentifier import PropertyWikidataIdentifier
+from util.changes import RecentChangesFeed, newest_change, parse_timestamp
+from util.import_planner import ImportPlanner
+from util.state import local_state
+from util.sync_pool import SyncPool
+from util.transport import edit_report
 from util.util import WikibaseImporter
 
+app_config = configparser.ConfigParser()
+app_config.read('config/application.config.ini')
+
 # connect to the wikibase
 wikibase = pywikibot.Site("my", "my")
 wikidata = pywikibot.Site("wikidata", "wikidata")
 
+# number of items whose links to wikidata are remembered
+LINK_CACHE = 10000
+
+# number of attempts to import a newly linked item
+ATTEMPTS = 3
+
 """
 THIS CLASS RUNS FREQUENTLY TO MONITOR THE CHANGES AND IMPORT WIKIDATA CHANGES IF ANY
 """
 
 
+# imports the newly linked wikidata items while the changes are still read: the queued items are taken by batches,
+# fetched from wikidata together and synchronized by the pool; the queued items are kept in the local state, so that
+# the items found before a restart are still imported
+class ImportStage:
+    def __init__(self, wikibase_importer, pool, batch_size, key='monitor queued items'):
+        self.wikibase_importer = wikibase_importer
+        self.pool = pool
+        self.planner = ImportPlanner(wikibase_importer, pool)
+        self.batch_size = batch_size
+        self.state = local_state()
+        self.key = key
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        # queued or importing, in the order they were found
+        self.pending = OrderedDict()
+        self.attempts = {}
+        self.importing = 0
+        self.imported = 0
+        self.failed = 0
+        self.start = time.time()
+        for id in self.state.get(key, []):
+            self.add(id)
+        threading.Thread(target=self._run, name='import-stage', daemon=True).start()
+
+    # queues the item unless it is queued already; False if it is
+    def add(self, id):
+        with self.lock:
+            if id in self.pending:
+                return False
+            self.pending[id] = True
+            self._save()
+        self.queue.put(id)
+        return True
+
+    # called with the lock held
+    def _save(self):
+        self.state.set(self.key, list(self.pending))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self.lock:
+                self.importing = len(batch)
+            try:
+                self._import(batch)
+            except Exception as e:
+                print("Could not import the batch ", e)
+            with self.lock:
+                self.importing = 0
+            print(self.report())
+            print(edit_report())
+
+    def _import(self, batch):
+        self.wikibase_importer.prefetch(batch)
+        # the entities the items refer to are created first, in parallel
+        self.planner.prepare(batch)
+        for id in batch:
+            self.pool.submit(lambda id=id: self._sync(id))
+        self.pool.join()
+        self.wikibase_importer.fetcher.clear()
+
+    def _sync(self, id):
+        try:
+            wikidata_item = self.wikibase_importer.fetcher.get(id)
+            self.wikibase_importer.change_item(wikidata_item, self.wikibase_importer.wikibase_repo, True)
+            self._done(id, not self.wikibase_importer.sync_failed(id))
+        except Exception as e:
+            print("Could not import ", id, e)
+            self._done(id, False)
+
+    def _done(self, id, imported):
+        with self.lock:
+            attempts = self.attempts.pop(id, 0) + 1
+            if imported:
+                self.imported = self.imported + 1
+            elif attempts < ATTEMPTS:
+                # tried again after the items queued since
+                self.attempts[id] = attempts
+                self.queue.put(id)
+                return
+            else:
+                self.failed = self.failed + 1
+            del self.pending[id]
+            self._save()
+
+    def report(self):
+        with self.lock:
+            minutes = max(time.time() - self.start, 1) / 60
+            return "items queued " + str(self.queue.qsize()) + ", importing " + str(self.importing) + \
+                   ", imported " + str(self.imported) + ", failed " + str(self.failed) + ", " + \
+                   str(round(self.imported / minutes, 1)) + " items/min"
+
+
 class MonitorChanges:
 
     def __init__(self,wikibase,wikidata):
@@ -35,60 +150,101 @@ class MonitorChanges:
         self.wikidata_code_property_id = identifier.itemIdentifier
         self.wikidata_pid_property_id = identifier.propertyIdentifier
         self.wikibase_importer = WikibaseImporter(wikibase_repo,wikidata_repo)
+        self.wikibase_importer.presync_support()
+        # the position after the last processed change is kept in the local state, every change is processed once;
+        # the first run starts 20 minutes ago
+        self.api = app_config.get('wikibase', 'apiUrl')
+        self.types = {'rctype': 'edit|new', 'rcprop': 'title|ids|timestamp|user'}
+        self.user = app_config.get('wikibase', 'user')
+        # the links to wikidata of the last changed items
+        self.links = OrderedDict()
+        self.link_pattern = re.compile(r'Property:' + self.wikidata_code_property_id + r'(?![0-9])')
+        self.feed = RecentChangesFeed('wikibase monitor', 20, url=self.api, extra=self.types)
+        self.last = None
+        # the changes are only read here, the items are imported by the stage
+        self.pool = SyncPool(self.wikibase_importer, wikidata_repo, wikibase_repo,
+                             app_config.getint('sync', 'workers', fallback=1))
+        self.imports = ImportStage(self.wikibase_importer, self.pool, app_config.getint('sync', 'batch', fallback=500))
+        self.detected = 0
+
+    # the wikidata ids the item links to, with one wbgetclaims request for the link property only
+    def link_values(self, item_id):
+        request = self.wikibase_repo.simple_request(action='wbgetclaims', entity=item_id,
+                                                    property=self.wikidata_code_property_id)
+        claims = request.submit().get('claims', {}).get(self.wikidata_code_property_id, [])
+        return [claim['mainsnak']['datavalue']['value'] for claim in claims if
+                claim['mainsnak'].get('snaktype') == 'value']
 
-    def get_claim(self, item_id):
-        entity = pywikibot.ItemPage(self.wikibase_repo, item_id)
-        claims = entity.get(u'claims')  # Get all the existing claims
-        return claims
+    # True if the edit added, changed or removed the link to wikidata, from the diff of the two revisions of the change
+    def link_changed(self, change):
+        request = self.wikibase_repo.simple_request(action='compare', fromrev=change.get('old_revid'),
+                                                    torev=change.get('revid'), prop='diff')
+        compare = request.submit().get('compare', {})
+        diff = compare.get('*', compare.get('body', ''))
+        return self.link_pattern.search(diff) is not None
 
+    # the wikidata ids the change newly linked the item to
     def check_differences(self, item_id, change):
         if item_id and item_id[0] == 'Q':
+            # the entities created by the importer have the link from the start
+            if change.get('user') == self.user:
+                return []
             print(f' changed item {item_id} : edit type {change.get("type")}')
-            item = pywikibot.ItemPage(self.wikibase_repo, item_id)
-            item.get()
-            existing_claims = self.get_claim(item.id)
-            if (u'' + self.wikidata_code_property_id + '' in existing_claims[u'claims'] and len(
-                    list(existing_claims.get('claims'))) > 1):
-                rev_text = []
-                for x in item.revisions(total=3, content=True):
-                    rev_text.append(x.text)
-                # RECENT REVISION CONTAINS WIKIDATAQID PROPERTY AND PREVIOUS REVISION DOES NOT CONTAINS THAT PROPERTY
-                if (json.loads(rev_text[0]).get('claims').get(self.wikidata_code_property_id, None) is not None and json.loads(rev_text[1]).get(
-                        'claims').get(self.wikidata_code_property_id, None) is None):
-                    wikidata_qid = existing_claims[u'claims'][self.wikidata_code_property_id][0].toJSON()['mainsnak']['datavalue']['value']
-                    print("Entity "+item_id+" has a new link to wikidata id "+wikidata_qid+" importing it ... ")
-                    wikidata_item = pywikibot.ItemPage(self.wikidata_repo, wikidata_qid)
-                    wikidata_item.get()
-                    self.wikibase_importer.change_item(wikidata_item, self.wikibase_repo, True)
-                else:
-                    return
-
-    # get changes
+            # most edits do not touch the link, the diff tells it without loading the item
+            if change.get('type') == 'edit' and change.get('old_revid'):
+                if not self.link_changed(change):
+                    return []
+            values = self.link_values(item_id)
+            known = self.links.get(item_id, ())
+            self.links[item_id] = values
+            self.links.move_to_end(item_id)
+            while len(self.links) > LINK_CACHE:
+                self.links.popitem(last=False)
+            new = [wikidata_qid for wikidata_qid in values if wikidata_qid not in known]
+            for wikidata_qid in new:
+                print("Entity "+item_id+" has a new link to wikidata id "+wikidata_qid+" importing it ... ")
+            return new
+        return []
+
+    # processes the changes since the last processed one
     def get_changes(self):
         print("Fetching changes ...")
-        current_time = self.wikibase.server_time()
-        requests=self.wikibase.recentchanges(start=current_time, end=current_time - timedelta(minutes=20))
-        response=requests.request.submit()
-        changes=response.get('query')['recentchanges']
-        for change in changes:
+        count = 0
+        for change in self.feed.changes():
             try:
-                if change.get('type') == 'new':
-                    item_id=change.get('title').split(':')[-1]
-                    self.check_differences(item_id, change)
-                elif change.get('type') == 'edit':
+                if change.get('type') == 'new' or change.get('type') == 'edit':
                     item_id = change.get('title').split(':')[-1]
-                    self.check_differences(item_id, change)
+                    for wikidata_qid in self.check_differences(item_id, change):
+                        self.detected = self.detected + 1
+                        self.imports.add(wikidata_qid)
             except Exception as e:
                 print(e)
-        return response
+            # a restart continues after this change, the items found are queued in the local state already
+            self.feed.save_after(change)
+            self.last = change
+            count = count + 1
+        print("Processed", count, "changes, lag", self.lag(), "s, new links", self.detected, ",", self.imports.report())
+        return count
+
+    # the seconds between the newest change in the wikibase and the last processed one
+    def lag(self):
+        newest = newest_change(self.api, self.types)
+        if newest is None:
+            return 0
+        if self.last is None:
+            if self.feed.position is None:
+                return 0
+            last = datetime.strptime(self.feed.position.split('|')[0], '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
+        else:
+            last = parse_timestamp(self.last['timestamp'])
+        return max(0, int((parse_timestamp(newest['timestamp']) - last).total_seconds()))
 
 
 def start():
     changes = MonitorChanges(wikibase,wikidata)
     while True:
         try:
-            res = changes.get_changes()
-            print(res)
+            changes.get_changes()
         except Exception as e:
             print(e)
         print('Wikiwata QID Change Monitor sleeps for 180s')
@@ -0,0 +1,53 @@
+#configuration for pywikibot
+import os
+import sys
+
+import pywikibot
+from pywikibot import config2
+import configparser
+app_config = configparser.ConfigParser()
+app_config.read('config/application.config.ini')
+
+"""
+THIS SCRIPT RUNS CONTINUOUSLY AND SYNCS THE MAPPED ENTITIES SECONDS AFTER THEY ARE EDITED IN WIKIDATA
+python sync_daemon.py             consumes the recentchange event stream
+python sync_daemon.py events.json replays the events stored in a file, one json event per line
+"""
+
+family = 'my'
+mylang = 'my'
+familyfile=os.path.relpath("./config/my_family.py")
+if not os.path.isfile(familyfile):
+  print ("family file %s is missing" % (familyfile))
+config2.register_family_file(family, familyfile)
+config2.password_file = "user-password.py"
+config2.usernames['my']['my'] = app_config.get('wikibase', 'user')
+
+#connect to the wikibase
+wikibase = pywikibot.Site("my", "my")
+wikibase_repo = wikibase.data_repository()
+wikibase_repo.login()
+
+#connect to wikidata
+wikidata = pywikibot.Site("wikidata", "wikidata")
+wikidata_repo = wikidata.data_repository()
+
+from util.util import WikibaseImporter
+from util.change_sync import ChangeCounters, ChangeSync
+from util.event_stream import SyncDaemon, replay_events, sse_events
+
+wikibase_importer = WikibaseImporter(wikibase_repo, wikidata_repo)
+wikibase_importer.presync_support()
+
+if len(sys.argv) > 1:
+    events = replay_events(sys.argv[1])
+else:
+    events = sse_events(app_config.get('daemon', 'stream', fallback='https://stream.wikimedia.org/v2/stream/recentchange'))
+
+daemon = SyncDaemon(ChangeSync(wikibase_importer, wikibase_repo, None, app_config.getint('sync', 'batch', fallback=500),
+                               app_config.getint('daemon', 'cache_ttl', fallback=300)),
+                    wikibase_importer.id, ChangeCounters(),
+                    window=app_config.getfloat('daemon', 'debounce', fallback=10),
+                    queue_size=app_config.getint('daemon', 'queue', fallback=1000),
+                    workers=app_config.getint('sync', 'workers', fallback=1))
+daemon.run(events)
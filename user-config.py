@@ -5,5 +5,7 @@ usernames['my']['my'] = u'BotName'
 password_file = "user-password.py"
 minthrottle = 0
 maxthrottle = 0
+# the edits are paced by util/rate_limiter.py
+put_throttle = 0
 max_retries = 100
 #verbose_output = True
@@ -1,49 +1,136 @@
 # this class makes the correspondence between Wikidata entities and entities in the Wikibase using the external
 # identifier for Wikidata
-from SPARQLWrapper import SPARQLWrapper, JSON
+import csv
+import time
+
 import configparser
 
+from util.compact_id_map import CompactIdMap
+from util.id_store import IdStore, reconcile
+from util.transport import sparql_csv, text_lines
+
 
 class IdSparql:
     def __init__(self, endpoint, item_identifier, property_identifier):
-        self.mapEntity = {}
-        self.mapProperty = {}
         self.endpoint = endpoint
         self.item_identifier = item_identifier
         self.property_identifier = property_identifier
         self.app_config = configparser.ConfigParser()
         self.app_config.read('config/application.config.ini')
+        # the compact backend keeps the numeric ids in sorted arrays, it uses much less memory than dicts of strings
+        if self.app_config.get('mapping', 'backend', fallback='dict') == 'compact':
+            self.mapEntity = CompactIdMap('Q')
+            self.mapProperty = CompactIdMap('P')
+        else:
+            self.mapEntity = {}
+            self.mapProperty = {}
+        self.store = None
+        # where the loading from the SPARQL endpoint resumes, when there is no store
+        self.offsets = {}
 
     def load(self):
-        sparql = SPARQLWrapper(self.endpoint)
-        query = """
-                            select ?item ?id where {
-                                ?item <""" + self.app_config.get('wikibase','propertyUri') + """/direct/""" + self.item_identifier + """> ?id
-                            }
-                        """
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        results = sparql.query().convert()
-        for result in results['results']['bindings']:
-            split = result['item']['value'].split('/')
-            id = split[len(split)-1]
-            if id.startswith('Q'):
-                self.mapEntity[result['id']['value']] = id
-        query = """
-                    select ?item ?id where {
-                        ?item <""" + self.app_config.get('wikibase','propertyUri') + """/direct/""" + self.property_identifier + """> ?id
-                    }
-                """
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        results = sparql.query().convert()
-        for result in results['results']['bindings']:
-            split = result['item']['value'].split('/')
-            id = split[len(split) - 1]
-            if id.startswith('P'):
-                self.mapProperty[result['id']['value']] = id
+        # with a local store the mapping is only loaded from the SPARQL endpoint the first time
+        path = self.app_config.get('mapping', 'store', fallback='')
+        if path == '':
+            self.load_from_sparql()
+            return
+        self.store = IdStore(path)
+        self.mapEntity = self.store.mapEntity
+        self.mapProperty = self.store.mapProperty
+        if self.store.is_empty() or self.store.get_meta('sparql_loaded') is None:
+            print("The id mapping store is not loaded yet, loading it from the SPARQL endpoint")
+            self.load_from_sparql()
+        elif self.app_config.getboolean('mapping', 'reconcile', fallback=True):
+            # the scripts started often (e.g. by cron) do not load the whole mapping at every start
+            reconciled = int(self.store.get_meta('reconciled', 0))
+            if time.time() - reconciled > self.app_config.getint('mapping', 'reconcile_interval', fallback=3600):
+                reconcile(self, background=True)
             else:
-                print("This should not happen")
+                print("The id mapping was reconciled", int(time.time() - reconciled), "s ago")
+
+    # loads the mapping page by page, every page is streamed as CSV and inserted in the map before the next one is
+    # requested; after a page failed too many times the next load starts again from this page
+    def load_from_sparql(self):
+        page_size = self.app_config.getint('mapping', 'page_size', fallback=100000)
+        if self.store is not None:
+            started = self.store.start_load()
+        self._load_pages('entity', self.item_identifier, 'Q', self.mapEntity, page_size)
+        self._load_pages('property', self.property_identifier, 'P', self.mapProperty, page_size)
+        if self.store is not None:
+            # the mappings the complete load did not see were removed from the wikibase
+            removed = self.store.finish_load(started, self.app_config.getint('mapping', 'reconcile_grace',
+                                                                             fallback=3600))
+            if removed > 0:
+                print("Removed", removed, "mappings that are not in the SPARQL endpoint anymore")
+            self.store.set_meta('sparql_loaded', 1)
+            self.store.set_meta('reconciled', int(time.time()))
+
+    def _load_pages(self, kind, identifier, prefix, mapping, page_size):
+        offset = int(self._get_offset(kind))
+        retries = self.app_config.getint('mapping', 'retries', fallback=5)
+        start = time.time()
+        while True:
+            query = """
+                    select ?item ?id where {
+                        ?item <""" + self.app_config.get('wikibase','propertyUri') + """/direct/""" + identifier + """> ?id
+                    } order by ?item limit """ + str(page_size) + """ offset """ + str(offset)
+            for attempt in range(retries + 1):
+                try:
+                    page = self._query_page(query, prefix)
+                    break
+                except Exception as e:
+                    if attempt == retries:
+                        print("Could not load the ", kind, " mapping at offset ", offset, ", the next load resumes there")
+                        raise
+                    print("Loading the ", kind, " mapping at offset ", offset, " failed, retrying ", e)
+                    time.sleep(2 ** attempt)
+            mapping.update(page[0])
+            offset = offset + page[1]
+            self._set_offset(kind, offset)
+            print("Loaded ", offset, " ", kind, " mappings in ", int(time.time() - start), "s")
+            if page[1] < page_size:
+                break
+        self._set_offset(kind, 0)
+
+    # the pairs of one page and the number of rows, the CSV is parsed while it is downloaded
+    def _query_page(self, query, prefix):
+        response = sparql_csv(self.endpoint, query)
+        pairs = []
+        rows = 0
+        try:
+            reader = csv.reader(text_lines(response))
+            next(reader, None)
+            for row in reader:
+                if len(row) < 2:
+                    continue
+                rows = rows + 1
+                split = row[0].split('/')
+                id = split[len(split) - 1]
+                if id.startswith(prefix):
+                    pairs.append((row[1], id))
+                else:
+                    print("This should not happen")
+        finally:
+            response.close()
+        return pairs, rows
+
+    def _get_offset(self, kind):
+        if self.store is not None:
+            return self.store.get_meta('sparql_offset_' + kind, 0)
+        return self.offsets.get(kind, 0)
+
+    def _set_offset(self, kind, offset):
+        if self.store is not None:
+            self.store.set_meta('sparql_offset_' + kind, offset)
+        else:
+            self.offsets[kind] = offset
+
+    # the given ids that have a correspondence in the wikibase, computed in one pass instead of one lookup per id
+    def filter_mapped(self, ids):
+        ids = set(ids)
+        items = [id for id in ids if id.startswith("Q")]
+        properties = [id for id in ids if id.startswith("P")]
+        return _intersect(self.mapEntity, items) + _intersect(self.mapProperty, properties)
 
     def get_id(self,id):
         if id.startswith("Q"):
@@ -67,4 +154,10 @@ class IdSparql:
         elif id.startswith("P"):
             return id in self.mapProperty
         else:
-            print('This should not happen')
\ No newline at end of file
+            print('This should not happen')
+
+
+def _intersect(mapping, ids):
+    if hasattr(mapping, 'intersect'):
+        return mapping.intersect(ids)
+    return sorted(mapping.keys() & set(ids), key=lambda id: int(id[1:]) if id[1:].isdigit() else 0)
@@ -5,6 +5,11 @@ import re
 
 from pywikibot.data.api import APIError
 
+from util.state import local_state
+
+ITEM_LABEL = "Wikidata QID"
+PROPERTY_LABEL = "Wikidata PID"
+
 
 class PropertyWikidataIdentifier:
 
@@ -13,34 +18,86 @@ class PropertyWikidataIdentifier:
         self.propertyIdentifier = None
 
     def get(self, wikibase_repo):
-        wikibase_item = pywikibot.PropertyPage(wikibase_repo, datatype='external-id')
+        # the identifiers found at a previous start, then a label search, the properties are only created if the
+        # search does not find them
+        state = local_state()
+        key = 'identifiers ' + str(wikibase_repo)
+        cached = state.get(key)
+        if cached is not None:
+            if self.valid(wikibase_repo, cached['item'], cached['property']):
+                self.itemIdentifier = cached['item']
+                self.propertyIdentifier = cached['property']
+                return
+            print("The cached Wikidata identifiers", cached, "are not valid anymore, searching them again")
+        self.search(wikibase_repo)
+        if self.itemIdentifier is None or self.propertyIdentifier is None:
+            self.create(wikibase_repo)
+        if self.itemIdentifier is not None and self.propertyIdentifier is not None:
+            state.set(key, {'item': self.itemIdentifier, 'property': self.propertyIdentifier})
+
+    # the cached properties still exist with their labels, checked with one request for both; they are kept when the
+    # request fails
+    def valid(self, wikibase_repo, item_identifier, property_identifier):
         try:
-            data = {}
-            mylabels = {"en": "Wikidata QID"}
-            mydescriptions = {"en": "Corresponding QID in Wikidata"}
-            data['labels'] = mylabels
-            data['descriptions'] = mydescriptions
-            wikibase_item.editEntity(data, summary=u'Insert a property to have a wikidata identifier')
-            self.itemIdentifier = str(wikibase_item.getID())
-        except (APIError, pywikibot.exceptions.OtherPageSaveError) as e:
-            # this happens when a property with the same label already exists
-            x = re.search(r'\[\[Property:.*\]\]', str(e))
-            if x:
-                self.itemIdentifier = str(x.group(0).replace("[[Property:", "").split("|")[0])
-            else:
-                print("This should not happen 1")
+            request = wikibase_repo.simple_request(action='wbgetentities',
+                                                   ids=item_identifier + '|' + property_identifier,
+                                                   props='labels|datatype', languages='en')
+            entities = request.submit()['entities']
+        except APIError as e:
+            print("Could not check the Wikidata identifiers ", e)
+            return True
+        for id, label in ((item_identifier, ITEM_LABEL), (property_identifier, PROPERTY_LABEL)):
+            entity = entities.get(id)
+            if entity is None or 'missing' in entity or entity.get('datatype') != 'external-id' or \
+                    entity.get('labels', {}).get('en', {}).get('value') != label:
+                return False
+        return True
+
+    # one search finds both properties, since both labels start with "Wikidata"
+    def search(self, wikibase_repo):
         try:
-            data = {}
-            mylabels = {"en": "Wikidata PID"}
-            mydescriptions = {"en": "id in wikidata of the corresponding properties"}
-            data['labels'] = mylabels
-            data['descriptions'] = mydescriptions
-            wikibase_item.editEntity(data, summary=u'Insert a property to have a wikidata identifier')
-            self.propertyIdentifier = str(wikibase_item.getID())
-        except (APIError, pywikibot.exceptions.OtherPageSaveError) as e:
-            # this happens when a property with the same label already exists
-            x = re.search(r'\[\[Property:.*\]\]', str(e))
-            if x:
-                self.propertyIdentifier = str(x.group(0).replace("[[Property:", "").split("|")[0])
-            else:
-                print("This should not happen 2")
+            for result in wikibase_repo.search_entities("Wikidata", "en", type='property'):
+                if result.get('label') == ITEM_LABEL and self.itemIdentifier is None:
+                    self.itemIdentifier = str(result.get('id'))
+                elif result.get('label') == PROPERTY_LABEL and self.propertyIdentifier is None:
+                    self.propertyIdentifier = str(result.get('id'))
+                if self.itemIdentifier is not None and self.propertyIdentifier is not None:
+                    break
+        except APIError as e:
+            print("Could not search the Wikidata identifiers ", e)
+
+    def create(self, wikibase_repo):
+        wikibase_item = pywikibot.PropertyPage(wikibase_repo, datatype='external-id')
+        if self.itemIdentifier is None:
+            try:
+                data = {}
+                mylabels = {"en": ITEM_LABEL}
+                mydescriptions = {"en": "Corresponding QID in Wikidata"}
+                data['labels'] = mylabels
+                data['descriptions'] = mydescriptions
+                wikibase_item.editEntity(data, summary=u'Insert a property to have a wikidata identifier')
+                self.itemIdentifier = str(wikibase_item.getID())
+            except (APIError, pywikibot.exceptions.OtherPageSaveError) as e:
+                # this happens when a property with the same label already exists
+                x = re.search(r'\[\[Property:.*\]\]', str(e))
+                if x:
+                    self.itemIdentifier = str(x.group(0).replace("[[Property:", "").split("|")[0])
+                else:
+                    print("This should not happen 1")
+        if self.propertyIdentifier is None:
+            wikibase_item = pywikibot.PropertyPage(wikibase_repo, datatype='external-id')
+            try:
+                data = {}
+                mylabels = {"en": PROPERTY_LABEL}
+                mydescriptions = {"en": "id in wikidata of the corresponding properties"}
+                data['labels'] = mylabels
+                data['descriptions'] = mydescriptions
+                wikibase_item.editEntity(data, summary=u'Insert a property to have a wikidata identifier')
+                self.propertyIdentifier = str(wikibase_item.getID())
+            except (APIError, pywikibot.exceptions.OtherPageSaveError) as e:
+                # this happens when a property with the same label already exists
+                x = re.search(r'\[\[Property:.*\]\]', str(e))
+                if x:
+                    self.propertyIdentifier = str(x.group(0).replace("[[Property:", "").split("|")[0])
+                else:
+                    print("This should not happen 2")
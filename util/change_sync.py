@@ -0,0 +1,144 @@
+# synchronizes the entities that changed in Wikidata: the change stream is deduplicated, intersected with the id
+# mapping in one pass, and the entities that remain are fetched in batches from both sides before they are synced
+import threading
+import time
+
+from util.entity_fetcher import EntityFetcher
+from util.import_planner import ImportPlanner
+from util.term_diff import TermDiff
+from util.transport import edit_report
+from util.util import languages
+
+
+# how many changes were seen, deduplicated, matched and synced in a run
+class ChangeCounters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.seen = 0
+        self.unique = 0
+        self.matched = 0
+        self.synced = 0
+        self.failed = 0
+
+    def add(self, name, n=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def report(self):
+        with self.lock:
+            return "changes seen " + str(self.seen) + ", entities " + str(self.unique) + ", mapped " + str(
+                self.matched) + ", synced " + str(self.synced) + ", failed " + str(self.failed) + " in " + str(
+                int(time.time() - self.start)) + "s"
+
+
+# the id of the entity from the title of a change, e.g. Q42 or Property:P31
+def title_to_id(title):
+    id = str(title).split(':')[-1]
+    if len(id) > 1 and id[0] in ('Q', 'P') and id[1:].isdigit():
+        return id
+    return None
+
+
+# the mapped entities among the changes, deduplicated
+def mapped_entities(changes, id_map, counters):
+    ids = set()
+    for change in changes:
+        counters.add('seen')
+        id = title_to_id(change['title'])
+        if id is not None:
+            ids.add(id)
+    counters.add('unique', len(ids))
+    mapped = id_map.filter_mapped(ids)
+    counters.add('matched', len(mapped))
+    return mapped
+
+
+class ChangeSync:
+    # with a ttl, the fetched entities of both sides are fetched again after ttl seconds, for the daemon that never
+    # ends a batch
+    def __init__(self, wikibase_importer, wikibase_repo, pool, batch_size=500, ttl=None):
+        self.wikibase_importer = wikibase_importer
+        self.wikibase_repo = wikibase_repo
+        self.pool = pool
+        self.batch_size = batch_size
+        self.wikibase_fetcher = EntityFetcher(wikibase_repo, ttl=ttl)
+        # the entities whose sync failed, to be synced again by the next run
+        self.failed = set()
+        self.failed_lock = threading.Lock()
+        if ttl is not None:
+            wikibase_importer.fetcher.ttl = ttl
+        self.planner = ImportPlanner(wikibase_importer, pool)
+        self.term_diff = TermDiff(languages)
+        # the term changes of the entities of the current batch
+        self.term_diffs = {}
+
+    # fetches the entities of both sides with batched requests and syncs them with the pool
+    def sync(self, ids, counters):
+        id_map = self.wikibase_importer.id
+        for i in range(0, len(ids), self.batch_size):
+            batch = ids[i:i + self.batch_size]
+            self.wikibase_importer.prefetch(batch)
+            self.wikibase_fetcher.prefetch([id_map.get_id(id) for id in batch])
+            self.planner.prepare(batch)
+            self.diff_terms(batch)
+            for id in batch:
+                self.pool.submit(lambda id=id: self.sync_one(id, counters))
+            self.pool.join()
+            self.wikibase_importer.fetcher.clear()
+            self.wikibase_fetcher.clear()
+            self.term_diffs = {}
+            print(edit_report())
+
+    # the term changes of the whole batch in one pass over the fetched json
+    def diff_terms(self, ids):
+        id_map = self.wikibase_importer.id
+        pairs = []
+        for id in ids:
+            wikidata_json = self.wikibase_importer.fetcher.get_json(id)
+            wikibase_json = self.wikibase_fetcher.get_json(id_map.get_id(id))
+            if wikidata_json is not None and wikibase_json is not None:
+                pairs.append((id, wikidata_json, wikibase_json))
+        diffs = self.term_diff.diff_pairs([(wikidata_json, wikibase_json) for id, wikidata_json, wikibase_json in pairs])
+        self.term_diffs = dict((pair[0], diff) for pair, diff in zip(pairs, diffs))
+
+    def sync_one(self, id, counters):
+        try:
+            wikidata_entity = self.wikibase_importer.fetcher.get(id)
+            if id.startswith("P"):
+                self.wikibase_importer.change_property(wikidata_entity, self.wikibase_repo, True)
+            else:
+                print("This entity ...", self.wikibase_importer.id.get_id(id),
+                      " corresponding to Wikidata entity " + id + " has changed and will be sync!")
+                # entities that have only the link to wikidata get only their labels changed
+                wikibase_item = self.wikibase_fetcher.get(self.wikibase_importer.id.get_id(id))
+                count = 0
+                for wikibase_claims in wikibase_item.claims:
+                    count = count + len(wikibase_item.claims.get(wikibase_claims))
+                if count > 1:
+                    # the prefetched wikibase item is not fetched again
+                    self.wikibase_importer.change_item(wikidata_entity, self.wikibase_repo, True, wikibase_item)
+                elif self.term_diffs.get(id) == {} and self.wikibase_importer.identifier.itemIdentifier in \
+                        wikibase_item.claims:
+                    print("The labels did not change")
+                else:
+                    print("Change only the labels")
+                    self.wikibase_importer.change_item(wikidata_entity, self.wikibase_repo, False, wikibase_item)
+            if self.wikibase_importer.sync_failed(id):
+                # some changes were not saved, the entity is synced again with the next changes
+                counters.add('failed')
+                with self.failed_lock:
+                    self.failed.add(id)
+            else:
+                counters.add('synced')
+        except Exception as e:
+            counters.add('failed')
+            with self.failed_lock:
+                self.failed.add(id)
+            raise e
+
+    # drops the fetched entity so that a later change fetches it again
+    def forget(self, id):
+        self.wikibase_importer.fetcher.forget(id)
+        if self.wikibase_importer.id.contains_id(id):
+            self.wikibase_fetcher.forget(self.wikibase_importer.id.get_id(id))
@@ -1,34 +1,145 @@
-import requests
+import time
 from datetime import datetime, timedelta,timezone
 
+from util import transport
+from util.state import local_state
+
+WIKIDATA_API = "https://wikidata.org/w/api.php"
+
+
+# the answer of the api to a query; an answer with an error or without the query (e.g. a page the server could not build)
+# is asked again after an increasing delay, the warnings are printed
+def _query(url, parameters, retries=5):
+    for attempt in range(retries + 1):
+        try:
+            data = transport.session().get(url=url, params=parameters).json()
+        except ValueError as e:
+            data = {'error': {'code': 'invalidjson', 'info': str(e)}}
+        if 'warnings' in data:
+            print("The recent changes api warns ", data['warnings'])
+        if 'error' not in data and 'query' in data:
+            return data
+        if attempt == retries:
+            raise RuntimeError("Could not read the recent changes: " + str(data.get('error', data)))
+        print("Reading the recent changes failed, retrying ", data.get('error', data))
+        time.sleep(2 ** attempt)
 
-def recent_changes(rccontinue, minutes, url ="https://wikidata.org/w/api.php"):
-    time = datetime.now(timezone.utc) - timedelta(minutes=minutes)
-    S = requests.Session()
 
+# yields the recent changes from the oldest to the newest, starting at the given time or at the given rccontinue; extra
+# parameters are added to the request, e.g. rctype
+def iter_recent_changes(start=None, rccontinue=None, url=WIKIDATA_API, extra=None):
     parameters = {
         "format": "json",
-        "rcprop": "title",
+        "rcprop": "title|ids|timestamp",
         "list": "recentchanges",
         "action": "query",
         "rclimit": "500",
-
+        "rcdir": "newer",
     }
+    if extra is not None:
+        parameters.update(extra)
     if rccontinue is not None:
         parameters['rccontinue'] = rccontinue
+    else:
+        parameters['rcstart'] = start.strftime('%Y-%m-%dT%H:%M:%SZ')
+    while True:
+        data = _query(url, parameters)
+        for change in data['query']['recentchanges']:
+            yield change
+        if 'continue' not in data:
+            return
+        parameters['rccontinue'] = data['continue']['rccontinue']
 
-    R = S.get(url=url, params=parameters)
-    data = R.json()
-    S.close()
 
-    date_time_obj = datetime.strptime(data['continue']['rccontinue'].split('|')[0], '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
-    date_time_obj = date_time_obj.astimezone(timezone.utc)
-    print("time ",time," date_time_obj ",date_time_obj)
-    if time < date_time_obj:
-        older_changes = recent_changes(data['continue']['rccontinue'], minutes)
-        return data['query']['recentchanges'] + older_changes
-    else:
-        print("Finished")
-        return data['query']['recentchanges']
+# the newest recent change, None if there is none
+def newest_change(url=WIKIDATA_API, extra=None):
+    parameters = {
+        "format": "json",
+        "rcprop": "title|ids|timestamp",
+        "list": "recentchanges",
+        "action": "query",
+        "rclimit": "1",
+        "rcdir": "older",
+    }
+    if extra is not None:
+        parameters.update(extra)
+    changes = _query(url, parameters)['query']['recentchanges']
+    if len(changes) == 0:
+        return None
+    return changes[0]
+
+
+def parse_timestamp(timestamp):
+    return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+
+
+# the rccontinue that resumes right after the given change
+def next_rccontinue(change):
+    timestamp = parse_timestamp(change['timestamp']).strftime('%Y%m%d%H%M%S')
+    return timestamp + '|' + str(change['rcid'] + 1)
+
+
+# yields every title once
+def unique_titles(changes):
+    seen = set()
+    for change in changes:
+        title = str(change['title'])
+        if title not in seen:
+            seen.add(title)
+            yield title
+
+
+# the recent changes since the previous run, the position is kept in the local state
+class RecentChangesFeed:
+    def __init__(self, name, minutes, url=WIKIDATA_API, extra=None):
+        self.key = 'recentchanges ' + name
+        self.minutes = minutes
+        self.url = url
+        self.extra = extra
+        self.state = local_state()
+        self.position = self.state.get(self.key)
+        self.count = 0
+
+    # the first run starts the given number of minutes ago
+    def changes(self):
+        if self.position is None:
+            start = datetime.now(timezone.utc) - timedelta(minutes=self.minutes)
+            changes = iter_recent_changes(start=start, url=self.url, extra=self.extra)
+        else:
+            changes = iter_recent_changes(rccontinue=self.position, url=self.url, extra=self.extra)
+        for change in changes:
+            self.count = self.count + 1
+            yield change
+            self.position = next_rccontinue(change)
+
+    def titles(self):
+        return unique_titles(self.changes())
+
+    # the entities whose sync failed in the previous run
+    def failed(self):
+        return self.state.get(self.key + ' failed', [])
+
+    # stores the position, the next run starts after the last change that was yielded; the entities whose sync failed
+    # are kept to be synced again by the next run
+    def save(self, failed=None):
+        if failed is not None:
+            self.state.set(self.key + ' failed', sorted(failed))
+        if self.position is not None:
+            self.state.set(self.key, self.position)
+
+    # stores the position right after the given change, e.g. as soon as it is processed
+    def save_after(self, change):
+        self.position = next_rccontinue(change)
+        self.save()
+
+
+def recent_changes(rccontinue, minutes, url=WIKIDATA_API):
+    if rccontinue is not None:
+        return list(iter_recent_changes(rccontinue=rccontinue, url=url))
+    time = datetime.now(timezone.utc) - timedelta(minutes=minutes)
+    return list(iter_recent_changes(start=time, url=url))
+
 
-recent_changes(None, 30)
\ No newline at end of file
+if __name__ == '__main__':
+    for change in recent_changes(None, 30):
+        print(change['title'])
@@ -0,0 +1,253 @@
+# a compact dict from Wikidata ids to Wikibase ids: the numeric parts of the ids are kept in two sorted arrays of 64 bit
+# integers and looked up with a binary search, which takes 16 bytes per entry instead of the hundreds of bytes of a
+# dict of strings
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+# new entries are collected in a small dict and merged into the arrays when there are that many of them
+MERGE_SIZE = 4096
+# bulk inserts are sorted and merged by chunks of that many entries
+UPDATE_SIZE = 1 << 20
+
+
+class CompactIdMap:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        # the sorted keys and their values, replaced together so that readers never see half of a merge
+        self.table = (array('q'), array('q'))
+        self.pending = {}
+        self.lock = threading.Lock()
+        # values that are not numeric ids of the same kind, e.g. ids of other entity types
+        self.others = {}
+
+    def _key(self, id):
+        if not id.startswith(self.prefix) or not id[1:].isdigit():
+            return None
+        return int(id[1:])
+
+    def _value(self, new_id):
+        if new_id == '-1':
+            return -1
+        if new_id.startswith(self.prefix) and new_id[1:].isdigit():
+            return int(new_id[1:])
+        return None
+
+    def _id(self, value):
+        if value == -1:
+            return '-1'
+        return self.prefix + str(value)
+
+    def _find(self, keys, key):
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return i
+        return -1
+
+    def __contains__(self, id):
+        key = self._key(id)
+        if key is None:
+            return id in self.others
+        return key in self.pending or self._find(self.table[0], key) >= 0
+
+    def __getitem__(self, id):
+        key = self._key(id)
+        if key is None:
+            return self.others[id]
+        value = self.pending.get(key)
+        if value is not None:
+            return self._id(value)
+        keys, values = self.table
+        i = self._find(keys, key)
+        if i < 0:
+            raise KeyError(id)
+        return self._id(values[i])
+
+    def get(self, id, default=None):
+        try:
+            return self[id]
+        except KeyError:
+            return default
+
+    def __setitem__(self, id, new_id):
+        key = self._key(id)
+        value = self._value(str(new_id))
+        if key is None or value is None:
+            self.others[id] = str(new_id)
+            return
+        with self.lock:
+            keys, values = self.table
+            i = self._find(keys, key)
+            if i >= 0:
+                values[i] = value
+                return
+            self.pending[key] = value
+            if len(self.pending) >= MERGE_SIZE:
+                self._merge()
+
+    # bulk insert, the pairs are sorted and merged into the arrays in chunks
+    def update(self, pairs):
+        if hasattr(pairs, 'items'):
+            pairs = pairs.items()
+        keys = array('q')
+        values = array('q')
+        for id, new_id in pairs:
+            key = self._key(id)
+            value = self._value(str(new_id))
+            if key is None or value is None:
+                self[id] = new_id
+                continue
+            keys.append(key)
+            values.append(value)
+            if len(keys) >= UPDATE_SIZE:
+                self._merge_chunk(keys, values)
+                keys = array('q')
+                values = array('q')
+        self._merge_chunk(keys, values)
+
+    def _merge_chunk(self, keys, values):
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        sorted_keys = array('q')
+        sorted_values = array('q')
+        for i in order:
+            # the last value of a key wins
+            if len(sorted_keys) > 0 and sorted_keys[-1] == keys[i]:
+                sorted_values[-1] = values[i]
+            else:
+                sorted_keys.append(keys[i])
+                sorted_values.append(values[i])
+        with self.lock:
+            self._merge()
+            table_keys, table_values = self.table
+            self.table = _merge_sorted(table_keys, table_values, sorted_keys, sorted_values)
+
+    # called with the lock held
+    def _merge(self):
+        if len(self.pending) == 0:
+            return
+        new_keys = sorted(self.pending)
+        keys, values = self.table
+        self.table = _merge_sorted(keys, values, new_keys, [self.pending[key] for key in new_keys])
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.table[0]) + len(self.pending) + len(self.others)
+
+    def items(self):
+        with self.lock:
+            self._merge()
+        keys, values = self.table
+        for i in range(len(keys)):
+            yield self.prefix + str(keys[i]), self._id(values[i])
+        for id in self.others:
+            yield id, self.others[id]
+
+    def __iter__(self):
+        for key, value in self.items():
+            yield key
+
+    # the given ids that are in the map, the ids are sorted and looked up in one pass over the arrays
+    def intersect(self, ids):
+        keys, values = self.table
+        numeric = sorted(set(key for key in (self._key(id) for id in ids) if key is not None))
+        found = []
+        i = 0
+        for key in numeric:
+            i = bisect_left(keys, key, i)
+            if (i < len(keys) and keys[i] == key) or key in self.pending:
+                found.append(self.prefix + str(key))
+        return found + sorted(id for id in set(ids) if id in self.others)
+
+    # the number of bytes used by the entries
+    def size(self):
+        keys, values = self.table
+        return keys.itemsize * len(keys) + values.itemsize * len(values)
+
+
+# a read-only CompactIdMap in a file written by write_snapshot: the arrays are memory-mapped, so that processes reading
+# the same file share its pages instead of each having a copy of the mapping
+class MappedIdMap:
+    def __init__(self, path, prefix):
+        self.prefix = prefix
+        self.mmap = None
+        self.keys = self.values = ()
+        with open(path, 'rb') as fp:
+            if os.fstat(fp.fileno()).st_size > 0:
+                self.mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                view = memoryview(self.mmap).cast('q')
+                self.keys = view[:len(view) // 2]
+                self.values = view[len(view) // 2:]
+
+    def _find(self, id):
+        if not id.startswith(self.prefix) or not id[1:].isdigit():
+            return -1
+        key = int(id[1:])
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return -1
+
+    def __contains__(self, id):
+        return self._find(id) >= 0
+
+    def __getitem__(self, id):
+        i = self._find(id)
+        if i < 0:
+            raise KeyError(id)
+        if self.values[i] == -1:
+            return '-1'
+        return self.prefix + str(self.values[i])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def close(self):
+        if self.mmap is not None:
+            self.keys.release()
+            self.values.release()
+            self.keys = self.values = ()
+            self.mmap.close()
+            self.mmap = None
+
+
+# writes the numeric entries of a map (a dict, a CompactIdMap or a SqliteIdMap) to a file read by MappedIdMap: the
+# sorted keys followed by their values, 8 bytes each
+def write_snapshot(mapping, prefix, path):
+    if not isinstance(mapping, CompactIdMap) or mapping.prefix != prefix:
+        compact = CompactIdMap(prefix)
+        compact.update(mapping.items())
+        mapping = compact
+    with mapping.lock:
+        mapping._merge()
+        keys, values = mapping.table
+    with open(path + '.tmp', 'wb') as fp:
+        keys.tofile(fp)
+        values.tofile(fp)
+    os.replace(path + '.tmp', path)
+    return len(keys)
+
+
+# merges two sorted lists of keys together with their values, for a key in both lists the second value is kept
+def _merge_sorted(keys1, values1, keys2, values2):
+    keys = array('q')
+    values = array('q')
+    i = 0
+    j = 0
+    while i < len(keys1) and j < len(keys2):
+        # copies the run of the first arrays that comes before the next key of the second list
+        end = bisect_left(keys1, keys2[j], i)
+        keys.extend(keys1[i:end])
+        values.extend(values1[i:end])
+        i = end
+        if i < len(keys1) and keys1[i] == keys2[j]:
+            i = i + 1
+        keys.append(keys2[j])
+        values.append(values2[j])
+        j = j + 1
+    keys.extend(keys1[i:])
+    values.extend(values1[i:])
+    keys.extend(keys2[j:])
+    values.extend(values2[j:])
+    return keys, values
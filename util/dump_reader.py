@@ -0,0 +1,140 @@
+# reads the entities of a Wikidata JSON dump (https://www.wikidata.org/wiki/Wikidata:Database_download): the dump is
+# decompressed by lbzip2, pbzip2 or pigz when one of them is installed, and the lines are parsed and filtered by a pool
+# of processes; at most a few chunks of lines are in memory at the same time
+import bz2
+import gzip
+import importlib
+import io
+import json
+import multiprocessing
+import re
+import shutil
+import subprocess
+import threading
+
+# the id is at the start of every line of the dump, the line is only parsed if the id is wanted
+ID = re.compile(r'"id":"([QP][0-9]+)"')
+
+# parallel decompressors, in order of preference
+DECOMPRESSORS = {'.bz2': ['lbzip2', 'pbzip2'], '.gz': ['pigz']}
+
+
+# the lines of a dump, compressed with bzip2 or gzip or not
+class DumpFile:
+    def __init__(self, path):
+        self.path = path
+        self.process = None
+        self.stream = None
+
+    def __enter__(self):
+        for extension, programs in DECOMPRESSORS.items():
+            if self.path.endswith(extension):
+                for program in programs:
+                    if shutil.which(program) is not None:
+                        self.process = subprocess.Popen([program, '-d', '-c', self.path], stdout=subprocess.PIPE)
+                        self.stream = io.TextIOWrapper(self.process.stdout, encoding='utf-8')
+                        return self.stream
+        if self.path.endswith('.bz2'):
+            self.stream = bz2.open(self.path, 'rt', encoding='utf-8')
+        elif self.path.endswith('.gz'):
+            self.stream = gzip.open(self.path, 'rt', encoding='utf-8')
+        else:
+            self.stream = open(self.path, encoding='utf-8')
+        return self.stream
+
+    def __exit__(self, *exc):
+        self.stream.close()
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+
+
+# the ids of a list file, one id per line, lines starting with # are comments
+def read_ids(path):
+    ids = set()
+    with open(path) as fp:
+        for line in fp:
+            line = line.strip()
+            if line.startswith('Q') or line.startswith('P'):
+                ids.add(line)
+    return ids
+
+
+# a predicate given as module:function, the function takes the entity json and returns True to keep it
+def load_predicate(name):
+    module, function = name.split(':')
+    return getattr(importlib.import_module(module), function)
+
+
+_ids = None
+_predicate = None
+
+
+def _init(ids, predicate):
+    global _ids, _predicate
+    _ids = ids
+    _predicate = load_predicate(predicate) if predicate else None
+
+
+# the json of the wanted entities of a chunk of lines
+def _parse(lines):
+    entities = []
+    for line in lines:
+        if _ids is not None:
+            match = ID.search(line)
+            if match is None or match.group(1) not in _ids:
+                continue
+        line = line.rstrip().rstrip(',')
+        if not line.startswith('{'):
+            continue
+        entity = json.loads(line)
+        # the id found above can be the one of a value, e.g. in the claims of a lexeme
+        if entity.get('type') not in ('item', 'property') or (_ids is not None and entity.get('id') not in _ids):
+            continue
+        if _predicate is None or _predicate(entity):
+            entities.append(entity)
+    return entities
+
+
+def _chunks(stream, chunk_size, slots):
+    chunk = []
+    for line in stream:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            slots.acquire()
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        slots.acquire()
+        yield chunk
+
+
+# yields the json of the entities of the dump that are in ids (if given) and for which the predicate (module:function,
+# if given) is true, in the order of the dump
+def dump_entities(path, ids=None, predicate=None, processes=None, chunk_size=1000):
+    processes = processes or multiprocessing.cpu_count()
+    if predicate:
+        # a predicate that cannot be loaded fails here instead of in every worker
+        load_predicate(predicate)
+    # the pool reads its input as fast as it can, the chunks in flight are bounded here
+    slots = threading.Semaphore(4 * processes)
+    with DumpFile(path) as stream:
+        with multiprocessing.Pool(processes, initializer=_init, initargs=(ids, predicate)) as pool:
+            for entities in pool.imap(_parse, _chunks(stream, chunk_size, slots)):
+                slots.release()
+                for entity in entities:
+                    yield entity
+
+
+# writes the json of the given entities as a gzip dump of the same format, one entity per line
+def write_dump(path, entities):
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as fp:
+        fp.write('[\n')
+        for entity in entities:
+            if count > 0:
+                fp.write(',\n')
+            fp.write(json.dumps(entity, ensure_ascii=False, separators=(',', ':')))
+            count = count + 1
+        fp.write('\n]\n')
+    return count
@@ -0,0 +1,156 @@
+# loads Wikidata (or Wikibase) entities with multi-id wbgetentities requests, so that a batch of entities costs one
+# request every 50 entities instead of one request per entity
+import threading
+import time
+from collections import OrderedDict
+
+import pywikibot
+
+# maximal number of ids in one wbgetentities request
+MAX_IDS = 50
+
+
+class EntityFetcher:
+    # with a ttl the loaded entities are fetched again after ttl seconds, for the long running scripts; without one they
+    # are kept until clear(), which the batch scripts call after every batch
+    def __init__(self, repo, batch_size=MAX_IDS, ttl=None):
+        self.repo = repo
+        self.batch_size = batch_size
+        self.ttl = ttl
+        # the pages and the time they were loaded, the oldest first
+        self.entities = OrderedDict()
+        self.lock = threading.Lock()
+
+    # drops the entities loaded more than ttl seconds ago, the lock is held
+    def _expire(self):
+        if self.ttl is None:
+            return
+        oldest = time.time() - self.ttl
+        while len(self.entities) > 0:
+            id, (page, loaded) = next(iter(self.entities.items()))
+            if loaded > oldest:
+                return
+            del self.entities[id]
+
+    def _put(self, id, page):
+        with self.lock:
+            self.entities.pop(id, None)
+            self.entities[id] = (page, time.time())
+            self._expire()
+
+    def _page(self, id):
+        with self.lock:
+            self._expire()
+            entry = self.entities.get(id)
+        return entry[0] if entry is not None else None
+
+    # fetches the entities that are not loaded yet
+    def prefetch(self, ids):
+        with self.lock:
+            self._expire()
+            missing = sorted(set(id for id in ids if id not in self.entities and _is_entity_id(id)))
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            request = self.repo.simple_request(action='wbgetentities', ids='|'.join(batch))
+            data = request.submit()
+            for id in batch:
+                entity = data['entities'].get(id)
+                # missing and redirected entities are left to the single fetch, that reports them as before
+                if entity is None or 'missing' in entity or entity.get('id') != id:
+                    continue
+                self.add_json(entity)
+        return len(missing)
+
+    # loads an entity from its json, e.g. read from a dump
+    def add_json(self, entity):
+        id = entity.get('id')
+        if id.startswith("Q"):
+            page = pywikibot.ItemPage(self.repo, id)
+        else:
+            page = pywikibot.PropertyPage(self.repo, id)
+        # the same as pywikibot does when preloading, get() parses the given content without a request
+        page._content = entity
+        page.get()
+        self._put(id, page)
+        return page
+
+    # the loaded entity, fetched on its own if it was not prefetched
+    def get(self, id):
+        page = self._page(id)
+        if page is not None:
+            return page
+        if id.startswith("Q"):
+            page = pywikibot.ItemPage(self.repo, id)
+        else:
+            page = pywikibot.PropertyPage(self.repo, id)
+        page.get()
+        self._put(id, page)
+        return page
+
+    def contains(self, id):
+        return self._page(id) is not None
+
+    # the json of the loaded entity, None if it is not loaded
+    def get_json(self, id):
+        page = self._page(id)
+        if page is None or not hasattr(page, '_content'):
+            return None
+        return page._content
+
+    def forget(self, id):
+        with self.lock:
+            self.entities.pop(id, None)
+
+    def size(self):
+        with self.lock:
+            self._expire()
+            return len(self.entities)
+
+    def clear(self):
+        with self.lock:
+            self.entities = OrderedDict()
+
+
+def _is_entity_id(id):
+    return len(id) > 1 and id[0] in ('Q', 'P') and id[1:].isdigit()
+
+
+# the snaks of the claims of an entity json, including the qualifiers and the references
+def snaks(entity_json):
+    for pid in entity_json.get('claims', {}):
+        for claim in entity_json.get('claims').get(pid):
+            yield claim.get('mainsnak')
+            for qualifier_pid in claim.get('qualifiers', {}):
+                for snak in claim.get('qualifiers').get(qualifier_pid):
+                    yield snak
+            for reference in claim.get('references', []):
+                for reference_pid in reference.get('snaks', {}):
+                    for snak in reference.get('snaks').get(reference_pid):
+                        yield snak
+
+
+# the ids of the properties, items, units and globes that the claims of an entity json refer to
+def referenced_ids(entity_json):
+    ids = set()
+    for snak in snaks(entity_json):
+        ids.add(snak.get('property'))
+        if snak.get('snaktype') != 'value' or snak.get('datavalue') is None:
+            continue
+        value = snak.get('datavalue').get('value')
+        if snak.get('datatype') == 'wikibase-item':
+            ids.add('Q' + str(value.get('numeric-id')))
+        elif snak.get('datatype') == 'wikibase-property':
+            ids.add('P' + str(value.get('numeric-id')))
+        elif snak.get('datatype') == 'quantity' and "entity/" in str(value.get('unit')):
+            ids.add(value.get('unit').split("entity/")[1])
+    return ids | globe_ids(entity_json)
+
+
+# the ids of the globes of the coordinates in an entity json
+def globe_ids(entity_json):
+    ids = set()
+    for snak in snaks(entity_json):
+        if snak.get('snaktype') == 'value' and snak.get('datatype') == 'globe-coordinate' and snak.get(
+                'datavalue').get('value').get('globe') is not None:
+            ids.add(snak.get('datavalue').get('value').get('globe').replace("http://www.wikidata.org/entity/", ""))
+    return ids
@@ -0,0 +1,168 @@
+# continuous synchronization from the Wikimedia recentchange event stream: the events are filtered by the id mapping,
+# repeated edits of an entity are coalesced during a short window, and the entities are synced from a bounded queue
+import json
+import queue
+import threading
+import time
+
+import requests
+
+from util import transport
+from util.change_sync import title_to_id
+
+STREAM_URL = "https://stream.wikimedia.org/v2/stream/recentchange"
+
+
+# yields the events of a server-sent event stream, reconnecting after the last received event when the connection drops
+def sse_events(url=STREAM_URL, session=None, retry=5):
+    if session is None:
+        session = transport.session()
+    last_id = None
+    while True:
+        headers = {'Accept': 'text/event-stream'}
+        if last_id is not None:
+            headers['Last-Event-ID'] = last_id
+        try:
+            with session.get(url, stream=True, headers=headers, timeout=(10, 60)) as response:
+                response.raise_for_status()
+                data = []
+                for line in response.iter_lines(decode_unicode=True):
+                    if line is None:
+                        continue
+                    if line == '':
+                        # an empty line ends the event
+                        if len(data) > 0:
+                            try:
+                                yield json.loads('\n'.join(data))
+                            except ValueError:
+                                print("Could not parse the event ", data)
+                        data = []
+                    elif line.startswith('data:'):
+                        data.append(line[5:].lstrip(' '))
+                    elif line.startswith('id:'):
+                        last_id = line[3:].strip()
+        except requests.exceptions.RequestException as e:
+            print("The event stream was interrupted, reconnecting ", e)
+        time.sleep(retry)
+
+
+# yields the events stored in a file, one json event per line, as a stand-in of the stream for testing
+def replay_events(path):
+    with open(path) as fp:
+        for line in fp:
+            line = line.strip()
+            if line != '' and not line.startswith('#'):
+                yield json.loads(line)
+
+
+# the id of the Wikidata entity an event is about, None for the other events
+def event_entity(event, wiki='wikidatawiki'):
+    if event.get('wiki') != wiki or event.get('type') not in ('edit', 'new'):
+        return None
+    return title_to_id(event.get('title', ''))
+
+
+# collects the entities to sync; an entity edited again before it is queued is only synced once, and the queue is
+# bounded so that the stream is read only as fast as the workers sync
+class Debouncer:
+    def __init__(self, window, queue_size):
+        self.window = window
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.due = {}
+        # the entities taken from due and not put in the queue yet
+        self.moving = 0
+        self.coalesced = 0
+
+    # False if the entity was already waiting
+    def add(self, id):
+        with self.lock:
+            if id in self.due:
+                self.coalesced = self.coalesced + 1
+                return False
+            self.due[id] = time.time() + self.window
+            return True
+
+    # moves the entities whose window is over to the queue, blocks while the queue is full
+    def flush(self):
+        now = time.time()
+        with self.lock:
+            ready = [id for id in self.due if self.due[id] <= now]
+        for id in ready:
+            # the entity leaves due before it is queued: an edit from now on waits for a new sync, even if a worker
+            # takes the entity from the queue right away
+            with self.lock:
+                del self.due[id]
+                self.moving = self.moving + 1
+            try:
+                self.queue.put(id)
+            finally:
+                with self.lock:
+                    self.moving = self.moving - 1
+
+    def pending(self):
+        with self.lock:
+            return len(self.due) + self.moving
+
+
+class SyncDaemon:
+    def __init__(self, change_sync, id_map, counters, window=10, queue_size=1000, workers=4):
+        self.change_sync = change_sync
+        self.id_map = id_map
+        self.counters = counters
+        self.debouncer = Debouncer(window, queue_size)
+        self.workers = workers
+        self.stopped = threading.Event()
+
+    def run(self, events, report_every=60):
+        threads = [threading.Thread(target=self._flush, name='debouncer', daemon=True)]
+        for i in range(self.workers):
+            threads.append(threading.Thread(target=self._work, name='sync-' + str(i), daemon=True))
+        for thread in threads:
+            thread.start()
+        last_report = time.time()
+        for event in events:
+            if self.stopped.is_set():
+                break
+            self.counters.add('seen')
+            id = event_entity(event)
+            if id is not None and self.id_map.contains_id(id):
+                self.counters.add('matched')
+                if self.debouncer.add(id):
+                    self.counters.add('unique')
+            # the reader waits here when the queue is full
+            while self.debouncer.pending() > self.debouncer.queue.maxsize and not self.stopped.is_set():
+                time.sleep(0.1)
+            if time.time() - last_report > report_every:
+                print(self.report())
+                last_report = time.time()
+        # a finite stream (a replay) is synced completely before stopping
+        while self.debouncer.pending() > 0:
+            time.sleep(0.1)
+        self.debouncer.queue.join()
+        self.stopped.set()
+        print(self.report())
+
+    def _flush(self):
+        while not self.stopped.is_set():
+            self.debouncer.flush()
+            time.sleep(0.2)
+
+    def _work(self):
+        while not self.stopped.is_set():
+            try:
+                id = self.debouncer.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self.change_sync.sync_one(id, self.counters)
+            except Exception as e:
+                print("Could not sync ", id, e)
+            finally:
+                # the next edit of the entity has to be fetched again
+                self.change_sync.forget(id)
+                self.debouncer.queue.task_done()
+
+    def report(self):
+        return self.counters.report() + ", coalesced " + str(self.debouncer.coalesced) + ", waiting " + str(
+            self.debouncer.pending()) + ", queued " + str(self.debouncer.queue.qsize())
@@ -0,0 +1,167 @@
+# canonical fingerprints of statements: two snaks that compare_claim considers equal get the same key, so claims of
+# a Wikidata entity and of a Wikibase entity can be matched with dictionary lookups instead of comparing all pairs
+
+
+# the key of a snak on the wikibase side, None if the snak can never be equal to another one
+def wikibase_snak_key(snak):
+    keys = _snak_keys(snak, snak.get('property'), _same_id, False)
+    if len(keys) == 0:
+        return None
+    return keys[0]
+
+
+# the keys of a snak on the wikidata side, the snak is equal to a wikibase snak if the key of the wikibase snak is one
+# of them; if id_map is given (an IdSparql) the ids are translated to the ids in the wikibase
+def wikidata_snak_keys(snak, id_map=None):
+    if id_map is None:
+        return _snak_keys(snak, snak.get('property'), _same_id, True)
+
+    def translate(id):
+        if id_map.contains_id(id):
+            return id_map.get_id(id)
+        return None
+
+    return _snak_keys(snak, translate(snak.get('property')), translate, True)
+
+
+def _same_id(id):
+    return id
+
+
+def _snak_keys(snak, propertyId, translate, wikidata_side):
+    if propertyId is None:
+        return ()
+    snaktype = snak.get('snaktype')
+    if snaktype == 'somevalue' or snaktype == 'novalue':
+        return ((propertyId, snaktype),)
+    datatype = snak.get('datatype')
+    if snak.get('datavalue') is None:
+        return ()
+    value = snak.get('datavalue').get('value')
+    if datatype == 'wikibase-item' or datatype == 'wikibase-property':
+        objectId = translate(('Q' if datatype == 'wikibase-item' else 'P') + str(value.get('numeric-id')))
+        if objectId is None:
+            return ()
+        return ((propertyId, datatype, objectId),)
+    elif datatype == 'monolingualtext':
+        return ((propertyId, datatype, value.get('text'), value.get('language')),)
+    elif datatype == 'commonsMedia' or datatype == 'string' or datatype == 'geo-shape':
+        return ((propertyId, datatype, value),)
+    elif datatype == 'url':
+        return ((propertyId, datatype, value[0:500]),)
+    elif datatype == 'external-id':
+        return ((propertyId, datatype, value, snak.get('datavalue').get('type')),)
+    elif datatype == 'globe-coordinate':
+        coordinate = (propertyId, datatype, value.get('latitude'), value.get('longitude'), value.get('altitude'),
+                      value.get('globe'))
+        # a missing precision in wikidata is imported with precision 1
+        if wikidata_side and value.get('precision') is None:
+            return (coordinate + (None,), coordinate + (1,))
+        return (coordinate + (value.get('precision'),),)
+    elif datatype == 'quantity':
+        unit = value.get('unit')
+        if not (unit is None or unit == '1'):
+            if "entity/" not in unit:
+                return ()
+            unit = translate(unit.split("entity/")[1])
+            if unit is None:
+                return ()
+            unit = 'entity/' + unit
+        return ((propertyId, datatype, value.get('amount'), value.get('upperBound'), value.get('lowerBound'), unit),)
+    elif datatype == 'time':
+        return ((propertyId, datatype, value.get('time'), value.get('precision'), value.get('after'),
+                 value.get('before'), value.get('timezone'), value.get('calendarmodel')),)
+    # tabular-data and unknown datatypes are never equal
+    return ()
+
+
+def _reference_snaks(claim_json):
+    for reference in claim_json.get('references'):
+        for pid in reference.get('snaks'):
+            for snak in reference.get('snaks').get(pid):
+                yield snak
+
+
+def _qualifier_snaks(claim_json):
+    for pid in claim_json.get('qualifiers'):
+        for snak in claim_json.get('qualifiers').get(pid):
+            yield snak
+
+
+# a statement of the wikibase, i.e. the side the wikidata statements are compared against
+class WikibaseStatement:
+    def __init__(self, claim_json, claim=None):
+        self.json = claim_json
+        self.claim = claim
+        self.rank = claim_json.get('rank')
+        self.value_key = wikibase_snak_key(claim_json.get('mainsnak'))
+        self.qualifier_keys = None
+        self.reference_keys = None
+        if 'qualifiers' in claim_json:
+            self.qualifier_keys = set(wikibase_snak_key(snak) for snak in _qualifier_snaks(claim_json))
+            self.qualifier_keys.discard(None)
+        if 'references' in claim_json:
+            self.reference_keys = set(wikibase_snak_key(snak) for snak in _reference_snaks(claim_json))
+            self.reference_keys.discard(None)
+
+    # the key under which equal wikidata statements are indexed
+    def index_key(self):
+        if self.value_key is None:
+            return None
+        return self.value_key, self.rank
+
+
+# a statement of wikidata, fingerprinted with the ids translated to the wikibase
+class WikidataStatement:
+    def __init__(self, claim_json, id_map=None, claim=None):
+        self.json = claim_json
+        self.claim = claim
+        self.rank = claim_json.get('rank')
+        self.value_keys = wikidata_snak_keys(claim_json.get('mainsnak'), id_map)
+        self.qualifier_keys = None
+        self.reference_keys = None
+        if 'qualifiers' in claim_json:
+            self.qualifier_keys = [wikidata_snak_keys(snak, id_map) for snak in _qualifier_snaks(claim_json)]
+        if 'references' in claim_json:
+            self.reference_keys = [wikidata_snak_keys(snak, id_map) for snak in _reference_snaks(claim_json)]
+        self.has_details = ('references' in claim_json and len(claim_json.get('references')) > 0) or (
+                'qualifiers' in claim_json and len(claim_json.get('qualifiers')) > 0)
+
+    def index_keys(self):
+        return [(key, self.rank) for key in self.value_keys]
+
+    # same result as the found_equal_value of compare_claim_with_qualifiers_and_references
+    def equals(self, wikibase_statement):
+        if self.rank != wikibase_statement.rank or wikibase_statement.value_key not in self.value_keys:
+            return False
+        return _covered(self.qualifier_keys, wikibase_statement.qualifier_keys) and _covered(
+            self.reference_keys, wikibase_statement.reference_keys)
+
+    # same result as the more_accurate of compare_claim_with_qualifiers_and_references, i.e. the wikidata statement
+    # has the same value but additionally qualifiers or references
+    def more_accurate_than(self, wikibase_statement):
+        return wikibase_statement.value_key in self.value_keys and wikibase_statement.qualifier_keys is None and \
+               wikibase_statement.reference_keys is None and self.has_details
+
+
+# every wikidata snak must have an equal snak in the wikibase, and both or none of the statements have the snaks
+def _covered(wikidata_keys, wikibase_keys):
+    if wikidata_keys is None or wikibase_keys is None:
+        return wikidata_keys is None and wikibase_keys is None
+    for keys in wikidata_keys:
+        if not any(key in wikibase_keys for key in keys):
+            return False
+    return True
+
+
+# indexes statements by their keys, keeping the order in which they were added
+def index_statements(statements):
+    index = {}
+    for statement in statements:
+        if isinstance(statement, WikibaseStatement):
+            keys = [statement.index_key()] if statement.index_key() is not None else []
+        else:
+            keys = statement.index_keys()
+        for key in keys:
+            index.setdefault(key, []).append(statement)
+    return index
@@ -0,0 +1,166 @@
+# persistent store of the correspondence between Wikidata ids and Wikibase ids, kept in a local SQLite database so that
+# a script start does not need to load the whole mapping from the SPARQL endpoint. The tables are read once into compact
+# in-memory maps, the lookups do not query the database; every row has the time it was last seen in the SPARQL endpoint
+# (or written by an import), so that a complete load from the endpoint can remove the mappings that are not there anymore
+import os
+import sqlite3
+import threading
+import time
+
+from util.compact_id_map import CompactIdMap
+
+
+class IdStore:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            for table in ('entity', 'property'):
+                self.connection.execute('CREATE TABLE IF NOT EXISTS ' + table +
+                                        ' (wikidata_id INTEGER PRIMARY KEY, wikibase_id TEXT, seen INTEGER DEFAULT 0)')
+                # stores created before the column existed
+                columns = [row[1] for row in self.connection.execute('PRAGMA table_info(' + table + ')')]
+                if 'seen' not in columns:
+                    self.connection.execute('ALTER TABLE ' + table + ' ADD COLUMN seen INTEGER DEFAULT 0')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.commit()
+        self.mapEntity = SqliteIdMap(self, 'entity', 'Q')
+        self.mapProperty = SqliteIdMap(self, 'property', 'P')
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        return row[0]
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+            self.connection.commit()
+
+    def delete_meta(self, key):
+        with self.lock:
+            self.connection.execute('DELETE FROM meta WHERE key = ?', (key,))
+            self.connection.commit()
+
+    # the time the current load from the SPARQL endpoint started, kept when a load is resumed after a restart
+    def start_load(self):
+        started = self.get_meta('load_started')
+        if started is None:
+            started = int(time.time())
+            self.set_meta('load_started', started)
+        return int(started)
+
+    # the load that started at the given time is complete: the mappings that it did not see and that were not written
+    # by an import in the grace seconds before it (the SPARQL endpoint can lag behind) are removed
+    def finish_load(self, started, grace=3600):
+        removed = 0
+        for mapping in (self.mapEntity, self.mapProperty):
+            removed = removed + mapping.remove_unseen(started - grace)
+        self.delete_meta('load_started')
+        return removed
+
+    def is_empty(self):
+        with self.lock:
+            for table in ('entity', 'property'):
+                if self.connection.execute('SELECT 1 FROM ' + table + ' LIMIT 1').fetchone() is not None:
+                    return False
+        return True
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# one table of the store seen as a dict from Wikidata ids to Wikibase ids, the ids are stored as integers; the reads
+# are served by a CompactIdMap loaded from the table, the writes go to both
+class SqliteIdMap:
+    def __init__(self, store, table, prefix):
+        self.store = store
+        self.table = table
+        self.prefix = prefix
+        self.memory = self._read()
+
+    def _read(self):
+        memory = CompactIdMap(self.prefix)
+        with self.store.lock:
+            rows = self.store.connection.execute('SELECT wikidata_id, wikibase_id FROM ' + self.table)
+            memory.update((self.prefix + str(key), value) for key, value in rows)
+        return memory
+
+    def _key(self, id):
+        if not id.startswith(self.prefix) or not id[1:].isdigit():
+            return None
+        return int(id[1:])
+
+    def __contains__(self, id):
+        return id in self.memory
+
+    def __getitem__(self, id):
+        return self.memory[id]
+
+    def __setitem__(self, id, new_id):
+        self.update({id: new_id})
+
+    def __len__(self):
+        return len(self.memory)
+
+    def __iter__(self):
+        for key, value in self.items():
+            yield key
+
+    def get(self, id, default=None):
+        return self.memory.get(id, default)
+
+    def items(self):
+        return self.memory.items()
+
+    # the given ids that are in the table
+    def intersect(self, ids):
+        return self.memory.intersect(ids)
+
+    def update(self, pairs):
+        if hasattr(pairs, 'items'):
+            pairs = pairs.items()
+        seen = int(time.time())
+        rows = [(self._key(id), str(new_id), seen) for id, new_id in pairs if self._key(id) is not None]
+        with self.store.lock:
+            self.store.connection.executemany(
+                'INSERT OR REPLACE INTO ' + self.table + ' (wikidata_id, wikibase_id, seen) VALUES (?, ?, ?)', rows)
+            self.store.connection.commit()
+            self.memory.update((self.prefix + str(key), value) for key, value, seen in rows)
+
+    # removes the rows last seen before the given time, the in-memory map is read again if there were any
+    def remove_unseen(self, before):
+        with self.store.lock:
+            removed = self.store.connection.execute('DELETE FROM ' + self.table + ' WHERE seen < ?',
+                                                    (before,)).rowcount
+            self.store.connection.commit()
+            if removed > 0:
+                self.memory = self._read()
+        return removed
+
+
+# updates the store with the mapping in the SPARQL endpoint, in a background thread if asked
+def reconcile(id_sparql, background=True):
+    def run():
+        start = time.time()
+        try:
+            id_sparql.load_from_sparql()
+            print("The id mapping was reconciled with the SPARQL endpoint in ", int(time.time() - start), "s")
+        except Exception as e:
+            print("Could not reconcile the id mapping with the SPARQL endpoint ", e)
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='reconcile-id-mapping', daemon=True)
+    thread.start()
+    return thread
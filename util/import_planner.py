@@ -0,0 +1,54 @@
+# creates, before a batch of entities is synchronized, the entities their claims refer to and that do not exist in the
+# wikibase yet; the workers create them in parallel, properties first, so that translating the claims of the batch does
+# not stop at every missing value to import it
+import pywikibot
+
+from util.entity_fetcher import referenced_ids
+
+
+class ImportPlanner:
+    def __init__(self, wikibase_importer, pool):
+        self.wikibase_importer = wikibase_importer
+        self.pool = pool
+
+    # the missing properties and items the claims of the given (fetched) entities refer to; an imported entity gets only
+    # its terms and the link to wikidata, so the entities it refers to are not needed and the closure stops here
+    def plan(self, ids):
+        missing = set()
+        for id in ids:
+            json_object = self.wikibase_importer.fetcher.get_json(id)
+            if json_object is not None:
+                for referenced_id in referenced_ids(json_object):
+                    if not self.wikibase_importer.id.contains_id(referenced_id):
+                        missing.add(referenced_id)
+        missing.difference_update(ids)
+        properties = sorted(id for id in missing if id.startswith("P"))
+        items = sorted(id for id in missing if id.startswith("Q"))
+        return properties, items
+
+    # imports the missing entities of the plan with the pool, the properties first since claims need them
+    def create(self, properties, items):
+        self.wikibase_importer.fetcher.prefetch(properties + items)
+        for ids, function in ((properties, self.wikibase_importer.importProperty),
+                              (items, self.wikibase_importer.importItem)):
+            for id in ids:
+                self.pool.submit(lambda id=id, function=function: self._create(id, function))
+            self.pool.join()
+
+    def _create(self, id, function):
+        if self.wikibase_importer.id.contains_id(id):
+            return
+        try:
+            entity = self.wikibase_importer.fetcher.get(id)
+        except pywikibot.exceptions.IsRedirectPage:
+            # translateClaim ignores them too
+            print("We are ignoring this")
+            return
+        function(entity)
+
+    # plans and creates what the given entities, prefetched with WikibaseImporter.prefetch, need
+    def prepare(self, ids):
+        properties, items = self.plan(ids)
+        if len(properties) + len(items) > 0:
+            print("Creating ", len(properties), " properties and ", len(items), " items referred to by the batch")
+            self.create(properties, items)
@@ -0,0 +1,253 @@
+# the changes of an entity computed on the raw wbgetentities json of both sides, without building pywikibot pages and
+# claims: the result is the data of a wbeditentity request. Claims whose translation needs pywikibot (files on
+# commons, entities that are not imported yet) are returned apart and translated with WikibaseImporter.translateClaim
+from util.fingerprint import WikibaseStatement, WikidataStatement, index_statements
+from util.term_diff import TermDiff, TERMS
+
+WIKIDATA_ENTITY = "http://www.wikidata.org/entity/"
+
+
+# a snak that cannot be translated from the json alone
+class Unresolved(Exception):
+    pass
+
+
+class JsonDiff:
+    # id_map is an IdSparql, unit_base the concept uri of the wikibase entities, e.g. http://localhost:8181/entity/;
+    # support the SupportEntities that synchronize the globes, without it (translation processes, dump translation)
+    # the globes are not synchronized
+    def __init__(self, id_map, languages, item_identifier, unit_base, properties=None, property_identifier=None,
+                 support=None):
+        self.id = id_map
+        self.term_diff = TermDiff(languages)
+        self.item_identifier = item_identifier
+        self.property_identifier = property_identifier
+        self.unit_base = unit_base
+        self.properties = properties
+        self.support = support
+        self.languages = frozenset(languages)
+
+    def _claims(self, entity_json):
+        claims = entity_json.get('claims') or {}
+        return [claim for pid in claims for claim in claims[pid]]
+
+    # the wikibase claims that are not in wikidata anymore, as (claim json, more accurate) where more accurate tells if
+    # the wikidata statement of the same property has more references and qualifiers; duplicates are removed too
+    def removals(self, wikidata_claims, wikibase_claims):
+        by_property = {}
+        statements = []
+        for wikidata_claim in wikidata_claims:
+            wikidata_propertyId = wikidata_claim.get('mainsnak').get('property')
+            # if the property is not there then they cannot be at the same time in wikibase and wikidata
+            if self.id.contains_id(wikidata_propertyId):
+                statement = WikidataStatement(wikidata_claim, self.id)
+                by_property.setdefault(self.id.get_id(wikidata_propertyId), []).append(statement)
+                statements.append(statement)
+        by_value = index_statements(statements)
+        removals = []
+        for wikibase_claim in wikibase_claims:
+            wikibase_statement = WikibaseStatement(wikibase_claim)
+            same_property = by_property.get(wikibase_claim.get('mainsnak').get('property'), [])
+            equal = [statement for statement in by_value.get(wikibase_statement.index_key(), []) if
+                     statement.equals(wikibase_statement)]
+            more_accurate = len(same_property) > 0 and same_property[-1].more_accurate_than(wikibase_statement)
+            if (len(same_property) > 0 and len(equal) == 0) or len(equal) > 1:
+                removals.append((wikibase_claim, more_accurate))
+        return removals
+
+    # the wikidata claims that have no equal claim in the wikibase, not counting the removed wikibase claims
+    def missing(self, wikidata_claims, wikibase_claims, removed=()):
+        removed = set(id(claim) for claim in removed)
+        by_value = index_statements(
+            [WikibaseStatement(claim) for claim in wikibase_claims if id(claim) not in removed])
+        missing = []
+        for wikidata_claim in wikidata_claims:
+            found = False
+            if self.id.contains_id(wikidata_claim.get('mainsnak').get('property')):
+                statement = WikidataStatement(wikidata_claim, self.id)
+                found = any(statement.equals(wikibase_statement) for key in statement.index_keys() for
+                            wikibase_statement in by_value.get(key, []))
+            if not found:
+                missing.append(wikidata_claim)
+        return missing
+
+    # the wikibase mapping of a wikidata id, Unresolved if the entity is not imported yet, None if it cannot be
+    def _mapped(self, id):
+        if not self.id.contains_id(id):
+            raise Unresolved(id)
+        mapped = self.id.get_id(id)
+        if mapped == '-1':
+            return None
+        return mapped
+
+    # the snak in the wikibase, None if it is not imported (as translateClaim returns None for it)
+    def translate_snak(self, snak):
+        propertyId = self._mapped(snak.get('property'))
+        datatype = snak.get('datatype')
+        if self.properties is not None:
+            wikibase_datatype = self.properties.wikibase_datatype(snak.get('property'))
+            if wikibase_datatype is not None and datatype not in (None, wikibase_datatype):
+                return None
+        if snak.get('snaktype') == 'somevalue':
+            return {'snaktype': 'somevalue', 'property': propertyId, 'datatype': datatype}
+        if snak.get('snaktype') != 'value' or propertyId is None:
+            return None
+        value = snak.get('datavalue').get('value')
+        if datatype == 'wikibase-item' or datatype == 'wikibase-property':
+            objectId = self._mapped(('Q' if datatype == 'wikibase-item' else 'P') + str(value.get('numeric-id')))
+            if objectId is None:
+                return None
+            datavalue = {'value': {'entity-type': 'item' if datatype == 'wikibase-item' else 'property',
+                                   'numeric-id': int(objectId[1:]), 'id': objectId}, 'type': 'wikibase-entityid'}
+        elif datatype == 'monolingualtext':
+            datavalue = {'value': {'text': value.get('text'), 'language': value.get('language')},
+                         'type': 'monolingualtext'}
+        elif datatype == 'globe-coordinate':
+            # as translateClaim, the coordinate keeps the wikidata uri of its globe
+            globe = value.get('globe') or WIKIDATA_ENTITY + 'Q2'
+            if self.support is not None:
+                globe = self.support.globe_uri(globe.replace(WIKIDATA_ENTITY, ''))
+            datavalue = {'value': {'latitude': value.get('latitude'), 'longitude': value.get('longitude'),
+                                   'altitude': value.get('altitude'), 'globe': globe,
+                                   'precision': value.get('precision') if value.get('precision') is not None else 1},
+                         'type': 'globecoordinate'}
+        elif datatype == 'time':
+            datavalue = {'value': dict((key, value.get(key)) for key in
+                                       ('time', 'precision', 'after', 'before', 'timezone', 'calendarmodel')),
+                         'type': 'time'}
+        elif datatype == 'quantity':
+            unit = value.get('unit')
+            if not (unit is None or unit == '1'):
+                unitId = self._mapped(unit.replace(WIKIDATA_ENTITY, ""))
+                if unitId is None:
+                    return None
+                unit = self.unit_base + unitId
+            quantity = {'amount': value.get('amount'), 'unit': unit if unit is not None else '1'}
+            if value.get('upperBound') is not None:
+                quantity['upperBound'] = value.get('upperBound')
+                quantity['lowerBound'] = value.get('lowerBound')
+            datavalue = {'value': quantity, 'type': 'quantity'}
+        elif datatype == 'url':
+            datavalue = {'value': value[0:500], 'type': 'string'}
+        elif datatype == 'external-id' or datatype == 'string':
+            datavalue = {'value': value, 'type': 'string'}
+        elif datatype == 'tabular-data':
+            return None
+        else:
+            # commonsMedia and geo-shape are checked on commons
+            raise Unresolved(datatype)
+        return {'snaktype': 'value', 'property': propertyId, 'datatype': datatype, 'datavalue': datavalue}
+
+    # the claim in the wikibase like translateClaim builds it: qualifiers that cannot be imported are left out, and
+    # every property of a reference becomes a reference of its own
+    def translate_claim(self, claim_json):
+        if claim_json.get('mainsnak').get('snaktype') != 'value':
+            return None
+        mainsnak = self.translate_snak(claim_json.get('mainsnak'))
+        if mainsnak is None:
+            return None
+        claim = {'mainsnak': mainsnak, 'type': 'statement', 'rank': claim_json.get('rank')}
+        qualifiers = {}
+        for snak in _qualifier_snaks(claim_json):
+            qualifier = self.translate_snak(snak)
+            if qualifier is not None:
+                qualifiers.setdefault(qualifier['property'], []).append(qualifier)
+        if len(qualifiers) > 0:
+            claim['qualifiers'] = qualifiers
+        references = []
+        for reference in claim_json.get('references', []):
+            for pid in reference.get('snaks', {}):
+                snaks = [snak for snak in (self.translate_snak(s) for s in reference.get('snaks').get(pid)) if
+                         snak is not None]
+                if len(snaks) > 0:
+                    references.append({'snaks': {snaks[0]['property']: snaks}})
+        if len(references) > 0:
+            claim['references'] = references
+        return claim
+
+    # the changes as (data of wbeditentity without the removals, removals as in removals(), wikidata claims that need
+    # translateClaim); keep_removals, if given, returns the removals that are done, the claims that it keeps count when
+    # looking for the missing claims
+    def diff(self, wikidata_json, wikibase_json, terms=True, statements=True, keep_removals=None):
+        data = {}
+        claims = []
+        removals = []
+        unresolved = []
+        if terms:
+            data.update(self.term_diff.diff(wikidata_json, wikibase_json))
+            # make a link to wikidata if it does not exist
+            if wikibase_json.get('type') == 'item' and len(
+                    (wikibase_json.get('claims') or {}).get(self.item_identifier, [])) == 0:
+                claims.append({'mainsnak': {'snaktype': 'value', 'property': self.item_identifier,
+                                            'datatype': 'external-id',
+                                            'datavalue': {'value': wikidata_json.get('id'), 'type': 'string'}},
+                               'type': 'statement', 'rank': 'normal'})
+        if statements:
+            if wikibase_json.get('type') == 'item':
+                sitelinks = self.sitelinks(wikidata_json, wikibase_json)
+                if len(sitelinks) > 0:
+                    data['sitelinks'] = sitelinks
+            wikidata_claims = self._claims(wikidata_json)
+            wikibase_claims = self._claims(wikibase_json)
+            removals = self.removals(wikidata_claims, wikibase_claims)
+            if keep_removals is not None and len(removals) > 0:
+                removals = keep_removals(removals)
+            for wikidata_claim in self.missing(wikidata_claims, wikibase_claims, [claim for claim, _ in removals]):
+                try:
+                    claim = self.translate_claim(wikidata_claim)
+                    if claim is not None:
+                        claims.append(claim)
+                except Unresolved:
+                    unresolved.append(wikidata_claim)
+        if len(claims) > 0:
+            data['claims'] = claims
+        return data, removals, unresolved
+
+    # the wikidata entity as a wikibase entity in the json format of the dumps, with its wikibase id if it is imported
+    # already; the claims that cannot be translated from the json alone are left out and returned apart
+    def translate_entity(self, wikidata_json):
+        entity = {'type': wikidata_json.get('type')}
+        if self.id.contains_id(wikidata_json.get('id')) and self.id.get_id(wikidata_json.get('id')) != '-1':
+            entity['id'] = self.id.get_id(wikidata_json.get('id'))
+        if entity['type'] == 'property':
+            entity['datatype'] = wikidata_json.get('datatype')
+        for term in TERMS:
+            terms = wikidata_json.get(term) or {}
+            entity[term] = dict((language, terms[language]) for language in terms.keys() & self.languages)
+        # the link to wikidata, as importItem and importProperty make it
+        identifier = self.item_identifier if entity['type'] == 'item' else self.property_identifier
+        claims = {}
+        if identifier is not None:
+            claims[identifier] = [{'mainsnak': {'snaktype': 'value', 'property': identifier, 'datatype': 'external-id',
+                                                'datavalue': {'value': wikidata_json.get('id'), 'type': 'string'}},
+                                   'type': 'statement', 'rank': 'normal'}]
+        unresolved = []
+        for wikidata_claim in self._claims(wikidata_json):
+            try:
+                claim = self.translate_claim(wikidata_claim)
+                if claim is not None:
+                    claims.setdefault(claim['mainsnak']['property'], []).append(claim)
+            except Unresolved:
+                unresolved.append(wikidata_claim)
+        entity['claims'] = claims
+        if entity['type'] == 'item':
+            entity['sitelinks'] = self.sitelinks(wikidata_json, {})
+        return entity, unresolved
+
+    # the sitelinks of the wikipedias of the languages
+    def sitelinks(self, wikidata_json, wikibase_json):
+        wikidata_sitelinks = wikidata_json.get('sitelinks') or {}
+        wikibase_sitelinks = wikibase_json.get('sitelinks') or {}
+        sitelinks = {}
+        for site in wikidata_sitelinks:
+            if site.endswith('wiki') and site[:-4] in self.languages:
+                title = wikidata_sitelinks[site].get('title')
+                if site not in wikibase_sitelinks or wikibase_sitelinks[site].get('title') != title:
+                    sitelinks[site] = {'site': site, 'title': title}
+        return sitelinks
+
+
+def _qualifier_snaks(claim_json):
+    for pid in claim_json.get('qualifiers', {}):
+        for snak in claim_json.get('qualifiers').get(pid):
+            yield snak
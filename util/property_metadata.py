@@ -0,0 +1,118 @@
+# the datatypes of the mapped properties on both sides, kept in a local SQLite database: they are fetched once in bulk
+# with wbgetentities requests of 50 properties and then read from memory when claims are translated and compared. The
+# mapped properties are only checked at the first use of the datatypes, the scripts that do not compare claims do not
+# wait for it
+import os
+import sqlite3
+import threading
+
+from util.entity_fetcher import MAX_IDS
+
+
+class PropertyMetadata:
+    def __init__(self, path=None):
+        self.lock = threading.Lock()
+        # wikidata id -> (wikidata datatype, wikibase id, wikibase datatype)
+        self.properties = {}
+        # wikibase id -> wikibase datatype, kept up to date with the properties
+        self.datatypes = {}
+        # the property map and the repos of the load done at the first use, None once it is done
+        self.source = None
+        self.load_lock = threading.Lock()
+        self.connection = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            with self.lock:
+                self.connection.execute(
+                    'CREATE TABLE IF NOT EXISTS property (wikidata_id TEXT PRIMARY KEY, wikidata_datatype TEXT, '
+                    'wikibase_id TEXT, wikibase_datatype TEXT)')
+                self.connection.commit()
+                for row in self.connection.execute(
+                        'SELECT wikidata_id, wikidata_datatype, wikibase_id, wikibase_datatype FROM property'):
+                    self.properties[row[0]] = (row[1], row[2], row[3])
+                    self.datatypes[row[2]] = row[3]
+
+    def get(self, wikidata_id):
+        if self.source is not None:
+            self.ensure_loaded()
+        with self.lock:
+            return self.properties.get(wikidata_id)
+
+    def wikidata_datatype(self, wikidata_id):
+        metadata = self.get(wikidata_id)
+        return None if metadata is None else metadata[0]
+
+    def wikibase_id(self, wikidata_id):
+        metadata = self.get(wikidata_id)
+        return None if metadata is None else metadata[1]
+
+    def wikibase_datatype(self, wikidata_id):
+        metadata = self.get(wikidata_id)
+        return None if metadata is None else metadata[2]
+
+    # the wikibase datatypes of the mapped properties, by wikibase id; the dict is shared and must not be changed
+    def wikibase_datatypes(self):
+        if self.source is not None:
+            self.ensure_loaded()
+        return self.datatypes
+
+    def put(self, wikidata_id, wikidata_datatype, wikibase_id, wikibase_datatype):
+        self.put_all([(wikidata_id, wikidata_datatype, wikibase_id, wikibase_datatype)])
+
+    def put_all(self, rows):
+        with self.lock:
+            for row in rows:
+                self.properties[row[0]] = (row[1], row[2], row[3])
+                self.datatypes[row[2]] = row[3]
+            if self.connection is not None:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO property (wikidata_id, wikidata_datatype, wikibase_id, wikibase_datatype) '
+                    'VALUES (?, ?, ?, ?)', rows)
+                self.connection.commit()
+
+    # the datatypes of the mapped properties are loaded at the first use
+    def load_later(self, property_map, wikidata_repo, wikibase_repo):
+        self.source = (property_map, wikidata_repo, wikibase_repo)
+
+    def ensure_loaded(self):
+        with self.load_lock:
+            if self.source is not None:
+                self.load(*self.source)
+                self.source = None
+
+    # fetches the datatypes of the mapped properties that are not known yet, or whose mapping changed
+    def load(self, property_map, wikidata_repo, wikibase_repo):
+        missing = []
+        with self.lock:
+            for wikidata_id, wikibase_id in property_map.items():
+                metadata = self.properties.get(wikidata_id)
+                if metadata is None or metadata[1] != str(wikibase_id):
+                    missing.append((wikidata_id, str(wikibase_id)))
+        if len(missing) == 0:
+            return 0
+        wikidata_datatypes = _datatypes(wikidata_repo, [wikidata_id for wikidata_id, wikibase_id in missing])
+        wikibase_datatypes = _datatypes(wikibase_repo, [wikibase_id for wikidata_id, wikibase_id in missing])
+        rows = []
+        for wikidata_id, wikibase_id in missing:
+            if wikidata_id in wikidata_datatypes and wikibase_id in wikibase_datatypes:
+                rows.append((wikidata_id, wikidata_datatypes[wikidata_id], wikibase_id, wikibase_datatypes[wikibase_id]))
+        self.put_all(rows)
+        print("Loaded the datatypes of", len(rows), "properties")
+        return len(rows)
+
+
+# the datatype of the given properties, with one request every 50 properties
+def _datatypes(repo, ids):
+    datatypes = {}
+    ids = sorted(set(id for id in ids if id.startswith('P')))
+    for i in range(0, len(ids), MAX_IDS):
+        batch = ids[i:i + MAX_IDS]
+        request = repo.simple_request(action='wbgetentities', ids='|'.join(batch), props='datatype')
+        data = request.submit()
+        for id, entity in data['entities'].items():
+            if 'datatype' in entity:
+                datatypes[id] = entity['datatype']
+    return datatypes
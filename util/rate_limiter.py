@@ -0,0 +1,87 @@
+# the rate of the edits sent to a wiki: a token bucket whose rate adapts to the server. The rate grows a little after
+# every edit that went through and is halved when the server asks to slow down (maxlag, ratelimited, 429 or 503); then
+# no request is sent to the wiki until the delay the server asked for (Retry-After) is over
+import threading
+import time
+
+
+class WriteLimiter:
+    # rate is the number of edits per second at the start, it stays between min_rate and max_rate; burst is the number
+    # of edits that can be sent at once after a quiet period, increase what the rate grows after every edit
+    def __init__(self, rate=5.0, min_rate=0.2, max_rate=50.0, burst=5, increase=0.05):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        # what is reported
+        self.started = None
+        self.edits = 0
+        self.waited = 0.0
+        self.paused = 0.0
+        self.slow_downs = {}
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # waits until an edit can be sent
+    def acquire(self):
+        start = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.started is None:
+                    self.started = now
+                if now >= self.paused_until:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens = self.tokens - 1
+                        self.waited = self.waited + now - start
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.paused_until - now
+            time.sleep(delay)
+
+    # waits until the wiki does not ask to slow down any more, for the requests that are not edits
+    def wait(self):
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    # an edit went through
+    def success(self):
+        with self.lock:
+            self.edits = self.edits + 1
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    # the wiki asked to wait the given number of seconds; the requests that got the same answer during the pause do
+    # not lower the rate again
+    def slow_down(self, seconds, reason):
+        with self.lock:
+            now = time.monotonic()
+            self.slow_downs[reason] = self.slow_downs.get(reason, 0) + 1
+            if now >= self.paused_until:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = 0
+            until = now + seconds
+            if until > self.paused_until:
+                self.paused = self.paused + until - max(now, self.paused_until)
+                self.paused_until = until
+                self.updated = max(self.updated, until)
+
+    def report(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started if self.started is not None else 0
+            rate = self.edits / elapsed if elapsed > 0 else 0
+            return "edits " + str(self.edits) + ", " + str(round(rate, 2)) + " edits/s (limit " + str(
+                round(self.rate, 2)) + "), waited for the limit " + str(int(self.waited)) + "s, paused by the wiki " + str(
+                int(self.paused)) + "s " + str(self.slow_downs)
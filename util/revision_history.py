@@ -0,0 +1,178 @@
+# the edit history of a wikibase entity, used to find who added a claim: the revision list is loaded without content,
+# the content is only fetched (50 revisions per request) as far back as needed and every revision is fingerprinted once
+import json
+import sys
+import threading
+from collections import ChainMap, OrderedDict
+
+from util.fingerprint import WikibaseStatement, WikidataStatement, index_statements
+
+
+# the fingerprints of the claims of revisions by revision id, revisions never change so they can be reused by later
+# syncs; the cache is bounded by an estimate of the memory the fingerprints take
+class RevisionCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.lock = threading.Lock()
+        # revision id -> (index of the statements, properties without a known datatype, size)
+        self.entries = OrderedDict()
+
+    # the statements of the revision indexed by their keys, None if the revision is not cached or was fingerprinted
+    # without the datatype of some of its properties that is known now
+    def get(self, revid, datatypes):
+        with self.lock:
+            entry = self.entries.get(revid)
+            if entry is None:
+                return None
+            index, untyped, size = entry
+            if any(property in datatypes for property in untyped):
+                del self.entries[revid]
+                self.bytes = self.bytes - size
+                return None
+            self.entries.move_to_end(revid)
+            return index
+
+    def put(self, revid, index, untyped):
+        size = _size(index)
+        with self.lock:
+            if revid in self.entries:
+                self.bytes = self.bytes - self.entries.pop(revid)[2]
+            self.entries[revid] = (index, untyped, size)
+            self.bytes = self.bytes + size
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                self.bytes = self.bytes - self.entries.popitem(last=False)[1][2]
+
+
+class RevisionHistory:
+    def __init__(self, repo, page, cache, batch_size=50):
+        self.repo = repo
+        self.cache = cache
+        self.batch_size = batch_size
+        # newest first
+        self.revisions = [(revision['revid'], revision['user']) for revision in page.revisions(content=False)]
+
+    def __len__(self):
+        return len(self.revisions)
+
+    def user(self, i):
+        return self.revisions[i][1]
+
+    def users(self):
+        return [user for revid, user in self.revisions]
+
+    # the indexed statements of the i-th revision, the content of the next revisions is fetched in the same request
+    def index(self, i, datatypes):
+        revid = self.revisions[i][0]
+        index = self.cache.get(revid, datatypes)
+        if index is None:
+            batch = [revid for revid, user in self.revisions[i:] if self.cache.get(revid, datatypes) is None][
+                    :self.batch_size]
+            index = self._fetch(batch, datatypes).get(revid)
+        return index
+
+    # fingerprints the fetched revisions with the given datatypes, the stored revisions have none
+    def _fetch(self, revids, datatypes):
+        request = self.repo.simple_request(action='query', prop='revisions', revids='|'.join(str(r) for r in revids),
+                                           rvprop='ids|content', rvslots='main')
+        data = request.submit()
+        fetched = {}
+        for page in data['query']['pages'].values():
+            for revision in page.get('revisions', []):
+                if 'slots' in revision:
+                    content = revision['slots']['main'].get('*', revision['slots']['main'].get('content'))
+                else:
+                    content = revision.get('*')
+                claims = {}
+                if content is not None:
+                    claims = json.loads(content).get('claims', {})
+                    # an empty entity is serialized with lists instead of objects
+                    if isinstance(claims, list):
+                        claims = {}
+                claims = [claim for pid in claims for claim in claims[pid]]
+                index = index_statements([_fingerprint(claim, datatypes) for claim in claims])
+                untyped = frozenset(snak.get('property') for claim in claims for snak in _snaks(claim) if
+                                    'datatype' not in snak and snak.get('property') not in datatypes)
+                self.cache.put(revision['revid'], index, untyped)
+                fetched[revision['revid']] = index
+        return fetched
+
+    # for every claim json the index of the revision where it was added, found in one pass from the newest to the
+    # oldest revision: the claim was added in the revision after the newest one that does not contain it
+    def added_in(self, claims_json, datatypes=None):
+        statements = [WikidataStatement(claim_json) for claim_json in claims_json]
+        # the stored revisions have no datatypes, they are taken from the given ones by property and from the claims
+        # that are looked for; snaks of other properties can never be equal to them anyway
+        claim_datatypes = {}
+        for claim_json in claims_json:
+            for snak in _snaks(claim_json):
+                if 'datatype' in snak:
+                    claim_datatypes[snak.get('property')] = snak.get('datatype')
+        # the given datatypes are shared, they are not copied
+        datatypes = ChainMap(claim_datatypes, datatypes or {})
+        added = [len(self.revisions) - 1] * len(statements)
+        unresolved = list(range(len(statements)))
+        for i in range(0, len(self.revisions)):
+            if len(unresolved) == 0:
+                break
+            index = self.index(i, datatypes)
+            still = []
+            for s in unresolved:
+                found = any(statements[s].equals(revision_statement) for key in statements[s].index_keys() for
+                            revision_statement in index.get(key, []))
+                if found:
+                    still.append(s)
+                else:
+                    added[s] = i - 1
+            unresolved = still
+        return added
+
+
+def _snaks(claim_json):
+    yield claim_json.get('mainsnak')
+    for pid in claim_json.get('qualifiers', {}):
+        for snak in claim_json.get('qualifiers').get(pid):
+            yield snak
+    for reference in claim_json.get('references', []):
+        for pid in reference.get('snaks', {}):
+            for snak in reference.get('snaks').get(pid):
+                yield snak
+
+
+# the fingerprint of a stored claim, without the claim itself that is not needed to compare it
+def _fingerprint(claim_json, datatypes):
+    statement = WikibaseStatement(_with_datatypes(claim_json, datatypes))
+    statement.json = None
+    return statement
+
+
+# an estimate of the bytes taken by the indexed fingerprints, the strings shared by several keys are counted each time
+def _size(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size = size + sum(_size(key) + _size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size = size + sum(_size(item) for item in value)
+    elif isinstance(value, WikibaseStatement):
+        size = size + _size(value.__dict__)
+    return size
+
+
+# a copy of a stored claim with the datatypes of its snaks
+def _with_datatypes(claim_json, datatypes):
+    def snak(s):
+        if 'datatype' in s or s.get('property') not in datatypes:
+            return s
+        s = dict(s)
+        s['datatype'] = datatypes[s.get('property')]
+        return s
+
+    claim = dict(claim_json)
+    claim['mainsnak'] = snak(claim_json.get('mainsnak'))
+    if 'qualifiers' in claim_json:
+        claim['qualifiers'] = dict((pid, [snak(s) for s in snaks]) for pid, snaks in claim_json['qualifiers'].items())
+    if 'references' in claim_json:
+        claim['references'] = [dict(reference, snaks=dict(
+            (pid, [snak(s) for s in snaks]) for pid, snaks in reference.get('snaks', {}).items())) for reference in
+                               claim_json['references']]
+    return claim
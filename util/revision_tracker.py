@@ -0,0 +1,88 @@
+# remembers for every synchronized entity the Wikidata revision it was synchronized from, so that a later sync can skip
+# the entities that did not change in Wikidata since then
+import os
+import sqlite3
+import threading
+
+# maximal number of titles in one prop=info request
+MAX_TITLES = 50
+
+
+class RevisionTracker:
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.skipped = 0
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            # statements is 1 if the claims were synchronized too, not only the terms
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS revision (wikidata_id TEXT PRIMARY KEY, lastrevid INTEGER, statements INTEGER)')
+            self.connection.commit()
+
+    def synced(self, id, lastrevid, statements):
+        if lastrevid is None:
+            return
+        with self.lock:
+            # a terms only sync of the same revision keeps the claims synchronized
+            self.connection.execute(
+                'INSERT INTO revision (wikidata_id, lastrevid, statements) VALUES (?, ?, ?) ON CONFLICT(wikidata_id) '
+                'DO UPDATE SET statements = CASE WHEN lastrevid = excluded.lastrevid THEN MAX(statements, '
+                'excluded.statements) ELSE excluded.statements END, lastrevid = excluded.lastrevid',
+                (id, int(lastrevid), 1 if statements else 0))
+            self.connection.commit()
+
+    # True if the entity was already synchronized from that revision
+    def is_synced(self, id, lastrevid, statements):
+        if lastrevid is None:
+            return False
+        with self.lock:
+            row = self.connection.execute('SELECT lastrevid, statements FROM revision WHERE wikidata_id = ?',
+                                          (id,)).fetchone()
+        return row is not None and row[0] == int(lastrevid) and (row[1] == 1 or not statements)
+
+    # the given ids without the ones whose current revision, fetched with batched prop=info requests, was synchronized
+    def changed(self, repo, ids, statements=True):
+        latest = latest_revisions(repo, ids)
+        changed = [id for id in ids if not self.is_synced(id, latest.get(id), statements)]
+        with self.lock:
+            self.skipped = self.skipped + len(ids) - len(changed)
+        return changed
+
+    # the next sync of the entity is done completely
+    def forget(self, id):
+        with self.lock:
+            self.connection.execute('DELETE FROM revision WHERE wikidata_id = ?', (id,))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# the current revision id of the given entities, missing entities are left out
+def latest_revisions(repo, ids, batch_size=MAX_TITLES):
+    ids = list(ids)
+    revisions = {}
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        titles = [('Property:' + id) if id.startswith('P') else id for id in batch]
+        request = repo.simple_request(action='query', prop='info', titles='|'.join(titles))
+        data = request.submit()
+        for page in data['query']['pages'].values():
+            if 'missing' in page or 'lastrevid' not in page:
+                continue
+            revisions[page['title'].split(':')[-1]] = page['lastrevid']
+    return revisions
+
+
+def revision_tracker(app_config):
+    path = app_config.get('sync', 'revisions', fallback='')
+    if path == '':
+        return None
+    return RevisionTracker(path)
@@ -0,0 +1,45 @@
+# small values that have to survive a restart (cached identifiers, positions in the change feeds), kept in a JSON file
+import configparser
+import json
+import os
+import threading
+
+
+class LocalState:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.values = {}
+        if os.path.isfile(path):
+            with open(path) as fp:
+                self.values = json.load(fp)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.values.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.values[key] = value
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            # written to a temporary file first so that a crash never leaves a truncated state
+            with open(self.path + '.tmp', 'w') as fp:
+                json.dump(self.values, fp, indent=2, sort_keys=True)
+            os.replace(self.path + '.tmp', self.path)
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+# the state configured in the application config, shared by all the users in the process
+def local_state():
+    app_config = configparser.ConfigParser()
+    app_config.read('config/application.config.ini')
+    path = app_config.get('state', 'file', fallback='state/state.json')
+    with _states_lock:
+        if path not in _states:
+            _states[path] = LocalState(path)
+        return _states[path]
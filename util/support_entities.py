@@ -0,0 +1,70 @@
+# the entities that claim values refer to (globes of coordinates, units of quantities) are synchronized once and then
+# reused by every claim for some time, instead of being synchronized again for every claim that refers to them
+import threading
+import time
+
+from util.json_diff import WIKIDATA_ENTITY
+
+
+class SupportEntities:
+    def __init__(self, wikibase_importer, ttl=3600):
+        self.wikibase_importer = wikibase_importer
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # wikidata id -> (wikibase entity, time it was synchronized)
+        self.resolved = {}
+        self.hits = 0
+
+    def _fresh(self, id):
+        with self.lock:
+            resolved = self.resolved.get(id)
+            if resolved is not None and time.time() - resolved[1] < self.ttl:
+                self.hits = self.hits + 1
+                return resolved
+        return None
+
+    # the wikibase entity corresponding to the wikidata entity, synchronized if it was not during the last ttl seconds;
+    # without update an existing entity is not changed, it is only imported if it is missing. The threads that need
+    # the same entity at the same time wait for the one that synchronizes it; the lock can be waited for although the
+    # threads hold the lock of the entity they sync, under it the entity locks are not waited for
+    def resolve(self, id, update=True):
+        resolved = self._fresh(id)
+        if resolved is not None:
+            return resolved[0]
+        with self.wikibase_importer.locks.hold('support ' + id, leaf=True):
+            resolved = self._fresh(id)
+            if resolved is not None:
+                return resolved[0]
+            wikibase_item = None
+            if update or not self.wikibase_importer.id.contains_id(id):
+                wikidata_item = self.wikibase_importer.fetcher.get(id)
+                wikibase_item = self.wikibase_importer.change_item(wikidata_item,
+                                                                   self.wikibase_importer.wikibase_repo, False)
+            with self.lock:
+                self.resolved[id] = (wikibase_item, time.time())
+            return wikibase_item
+
+    # the globe of a coordinate in the wikibase: the globe is synchronized, the coordinate keeps the wikidata concept
+    # uri of its globe as wikibases do
+    def globe_uri(self, id):
+        self.resolve(id)
+        return WIKIDATA_ENTITY + id
+
+    # True if the entity was resolved during the last ttl seconds
+    def is_fresh(self, id):
+        with self.lock:
+            resolved = self.resolved.get(id)
+            return resolved is not None and time.time() - resolved[1] < self.ttl
+
+    # synchronizes the given entities, at the start of a bulk run
+    def presync(self, ids):
+        self.wikibase_importer.fetcher.prefetch(ids)
+        for id in ids:
+            try:
+                self.resolve(id)
+            except Exception as e:
+                print("Could not synchronize ", id, e)
+
+    def forget(self, id):
+        with self.lock:
+            self.resolved.pop(id, None)
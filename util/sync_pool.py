@@ -0,0 +1,96 @@
+# synchronizes many entities with a pool of workers, so that the reads from Wikidata, the reads from the Wikibase and
+# the writes of different entities overlap
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+
+# one lock per entity, so that two workers never edit the same entity at the same time
+class EntityLocks:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}
+        self.held = threading.local()
+
+    # holds the lock of the entity; when the thread already edits another entity it does not wait (this would allow
+    # two workers to wait on each other) and yields False if the entity is edited by another worker, except for leaf
+    # locks, i.e. locks under which no other lock is taken
+    @contextmanager
+    def hold(self, id, leaf=False):
+        held = getattr(self.held, 'ids', None)
+        if held is None:
+            held = self.held.ids = []
+        if id in held:
+            yield True
+            return
+        with self.lock:
+            if id not in self.locks:
+                self.locks[id] = [threading.Lock(), 0]
+            entry = self.locks[id]
+            entry[1] = entry[1] + 1
+        acquired = entry[0].acquire(blocking=leaf or len(held) == 0)
+        try:
+            if acquired:
+                held.append(id)
+            yield acquired
+        finally:
+            if acquired:
+                held.remove(id)
+                entry[0].release()
+            with self.lock:
+                entry[1] = entry[1] - 1
+                if entry[1] == 0:
+                    del self.locks[id]
+
+
+class SyncPool:
+    def __init__(self, wikibase_importer, wikidata_repo, wikibase_repo, workers):
+        self.wikibase_importer = wikibase_importer
+        self.wikidata_repo = wikidata_repo
+        self.wikibase_repo = wikibase_repo
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # do not queue more entities than the workers can take, the lists can contain millions of ids
+        self.slots = threading.Semaphore(2 * workers)
+        self.futures = []
+
+    # the id is a Wikidata id, or a function doing the synchronization
+    def submit(self, id, statements=True):
+        self.slots.acquire()
+        if callable(id):
+            future = self.executor.submit(self._run, id)
+        else:
+            future = self.executor.submit(self._run, lambda: self.sync(id, statements))
+        self.futures = [f for f in self.futures if not f.done()]
+        self.futures.append(future)
+        return future
+
+    def _run(self, function):
+        try:
+            return function()
+        except Exception as e:
+            print("Could not sync the entity ", e)
+            traceback.print_exc()
+        finally:
+            self.slots.release()
+
+    def sync(self, id, statements=True):
+        # the entity was usually prefetched in a batch with WikibaseImporter.prefetch
+        if id.startswith("Q"):
+            wikidata_item = self.wikibase_importer.fetcher.get(id)
+            return self.wikibase_importer.change_item(wikidata_item, self.wikibase_repo, statements)
+        elif id.startswith("P"):
+            wikidata_property = self.wikibase_importer.fetcher.get(id)
+            return self.wikibase_importer.change_property(wikidata_property, self.wikibase_repo, statements)
+
+    # waits until all the submitted entities are synchronized
+    def join(self):
+        for future in list(self.futures):
+            future.result()
+        self.futures = []
+
+    def shutdown(self):
+        self.join()
+        self.executor.shutdown()
@@ -0,0 +1,34 @@
+# the differences of the labels, descriptions and aliases of entities, computed on the raw wbgetentities json with the
+# languages to synchronize as a set, without building the pywikibot pages
+TERMS = ('labels', 'descriptions', 'aliases')
+
+
+class TermDiff:
+    def __init__(self, languages):
+        self.languages = frozenset(languages)
+
+    # the diff of every pair, one after the other
+    def diff_pairs(self, pairs):
+        return [self.diff(wikidata_json, wikibase_json) for wikidata_json, wikibase_json in pairs]
+
+    # the changed terms of a wikidata entity json and the json of the wikibase entity (None for an entity that does not
+    # exist yet) as given to editEntity: labels and descriptions by language, aliases as lists
+    def diff(self, wikidata_json, wikibase_json):
+        diff = {}
+        for term in TERMS:
+            wikidata_terms = wikidata_json.get(term) or {}
+            wikibase_terms = {} if wikibase_json is None else (wikibase_json.get(term) or {})
+            changed = {}
+            for language in wikidata_terms.keys() & self.languages:
+                if term == 'aliases':
+                    value = [alias['value'] for alias in wikidata_terms[language]]
+                    if language not in wikibase_terms or value != [alias['value'] for alias in
+                                                                   wikibase_terms[language]]:
+                        changed[language] = value
+                else:
+                    value = wikidata_terms[language]['value']
+                    if language not in wikibase_terms or value != wikibase_terms[language]['value']:
+                        changed[language] = value
+            if len(changed) > 0:
+                diff[term] = changed
+        return diff
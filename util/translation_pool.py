@@ -0,0 +1,165 @@
+# diffs the json of large entities (fingerprints of the claims, comparison, wbeditentity data) in a pool of processes
+# instead of in the threads of the sync workers, which all share one core because of the GIL. The processes read the id
+# mapping from a memory-mapped snapshot; ids that were imported after the snapshot was written are detected and the
+# entity is then diffed in the calling thread as before
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from util.compact_id_map import MappedIdMap, write_snapshot
+from util.json_diff import JsonDiff
+
+
+# the id mapping of a snapshot, with the IdSparql methods JsonDiff and the fingerprints use; remembers the ids it did
+# not find
+class SnapshotIdMap:
+    def __init__(self, directory, generation):
+        self.mapEntity = MappedIdMap(_snapshot_path(directory, generation, 'Q'), 'Q')
+        self.mapProperty = MappedIdMap(_snapshot_path(directory, generation, 'P'), 'P')
+        self.unknown = set()
+
+    def _map(self, id):
+        if id.startswith("Q"):
+            return self.mapEntity
+        elif id.startswith("P"):
+            return self.mapProperty
+        return None
+
+    def contains_id(self, id):
+        mapping = self._map(id)
+        if mapping is not None and id in mapping:
+            return True
+        self.unknown.add(id)
+        return False
+
+    def get_id(self, id):
+        mapping = self._map(id)
+        if mapping is None:
+            raise NameError('This should not happen')
+        return mapping[id]
+
+    def close(self):
+        self.mapEntity.close()
+        self.mapProperty.close()
+
+
+# the wikibase datatypes of the properties as PropertyMetadata gives them, without its database
+class _Datatypes:
+    def __init__(self, datatypes):
+        self.datatypes = datatypes
+
+    def wikibase_datatype(self, wikidata_id):
+        return self.datatypes.get(wikidata_id)
+
+
+def _snapshot_path(directory, generation, prefix):
+    return os.path.join(directory, prefix + '.' + str(generation) + '.ids')
+
+
+# the state of a worker process
+_directory = None
+_settings = None
+_generation = None
+_id_map = None
+_json_diff = None
+
+
+def _init(directory, settings):
+    global _directory, _settings
+    _directory = directory
+    _settings = settings
+
+
+def _open(generation):
+    global _generation, _id_map, _json_diff
+    if generation == _generation:
+        return
+    if _id_map is not None:
+        _id_map.close()
+    _id_map = SnapshotIdMap(_directory, generation)
+    languages, item_identifier, unit_base, datatypes, property_identifier = _settings
+    _json_diff = JsonDiff(_id_map, languages, item_identifier, unit_base, _Datatypes(datatypes), property_identifier)
+    _generation = generation
+
+
+def _diff(task):
+    generation, wikidata_json, wikibase_json, terms, statements = task
+    _open(generation)
+    _id_map.unknown = set()
+    data, removals, unresolved = _json_diff.diff(wikidata_json, wikibase_json, terms, statements)
+    # the removed claims are sent back by their position, the caller has them already
+    positions = dict((id(claim), i) for i, claim in enumerate(_json_diff._claims(wikibase_json)))
+    removals = [(positions[id(claim)], more_accurate) for claim, more_accurate in removals]
+    return (data, removals, unresolved), _id_map.unknown
+
+
+class TranslationPool:
+    # id_map is the IdSparql of the importer, properties its PropertyMetadata; the snapshot of the mapping is written
+    # again at most every refresh seconds when entities had to be diffed in the calling thread because of it
+    def __init__(self, id_map, properties, languages, item_identifier, property_identifier, unit_base, processes,
+                 refresh=60):
+        self.id_map = id_map
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.directory = tempfile.mkdtemp(prefix='translation-pool-')
+        self.generation = 0
+        self.written = 0
+        self._snapshot()
+        properties.ensure_loaded()
+        datatypes = dict((wikidata_id, metadata[2]) for wikidata_id, metadata in properties.properties.items())
+        # the workers are forked before the sync threads start, they get the snapshot and not the mapping in memory
+        context = multiprocessing.get_context('fork')
+        self.pool = context.Pool(processes, initializer=_init, initargs=(
+            self.directory, (list(languages), item_identifier, unit_base, datatypes, property_identifier)))
+        self.diffed = 0
+        self.stale = 0
+
+    def _snapshot(self):
+        generation = self.generation + 1
+        start = time.time()
+        entities = write_snapshot(self.id_map.mapEntity, 'Q', _snapshot_path(self.directory, generation, 'Q'))
+        properties = write_snapshot(self.id_map.mapProperty, 'P', _snapshot_path(self.directory, generation, 'P'))
+        # the workers can still be reading the previous one, the files before it are not used anymore
+        for prefix in ('Q', 'P'):
+            path = _snapshot_path(self.directory, generation - 2, prefix)
+            if os.path.isfile(path):
+                os.remove(path)
+        self.generation = generation
+        self.written = time.time()
+        print("Wrote the snapshot of", entities, "entity and", properties, "property mappings in",
+              round(time.time() - start, 1), "s")
+
+    # the same as JsonDiff.diff, computed by a worker process; None if the snapshot misses ids that were imported since,
+    # then the caller diffs the entity itself
+    def diff(self, wikidata_json, wikibase_json, terms=True, statements=True):
+        result, unknown = self.pool.apply(_diff, ((self.generation, wikidata_json, wikibase_json, terms, statements),))
+        data, removals, unresolved = result
+        if any(self.id_map.contains_id(id) for id in unknown):
+            with self.lock:
+                self.stale = self.stale + 1
+                if time.time() - self.written > self.refresh:
+                    self._snapshot()
+            return None
+        with self.lock:
+            self.diffed = self.diffed + 1
+        claims = [claim for pid in (wikibase_json.get('claims') or {}) for claim in wikibase_json['claims'][pid]]
+        return data, [(claims[i], more_accurate) for i, more_accurate in removals], unresolved
+
+    def report(self):
+        with self.lock:
+            return "diffed in the translation processes " + str(self.diffed) + ", in the sync threads " + str(
+                self.stale)
+
+    def close(self):
+        self.pool.terminate()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+
+# the number of claims of an entity json
+def claim_count(entity_json):
+    claims = entity_json.get('claims') or {}
+    return sum(len(claims[pid]) for pid in claims)
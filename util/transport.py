@@ -0,0 +1,195 @@
+# the HTTP transport shared by all the clients of the project (pywikibot, the SPARQL queries, the recent changes and
+# the event stream): one session whose connections are kept alive and pooled per host, gzip responses, a default
+# timeout and at most [http] concurrency requests sent to one host at the same time. The edits are sent at the rate of
+# the WriteLimiter of their host, and the requests the server answers with maxlag, ratelimited, 429 or 503 are sent
+# again after the delay it asks for
+import codecs
+import configparser
+import json
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from util.rate_limiter import WriteLimiter
+
+# the api actions that edit an entity or a page
+WRITE_ACTIONS = re.compile(r'(?:^|&)action=(wbeditentity|wbset[a-z]+|wbcreateclaim|wbremove[a-z]+|wblinktitles|'
+                           r'wbmergeitems|edit)(?:&|$)')
+# the delay when the server does not say how long to wait
+DEFAULT_DELAY = 5
+
+
+class PooledAdapter(HTTPAdapter):
+    # connections is the number of connections kept alive per host, concurrency the number of requests sent to one
+    # host at the same time; a request waits for a free slot until its response headers are received, the body of a
+    # streamed response (e.g. the event stream) is then read without holding the slot. limits are the arguments of the
+    # WriteLimiter of every host, attempts the number of times a request is sent again when the server asks to wait
+    def __init__(self, connections=10, concurrency=8, retries=3, timeout=60, limits=None, attempts=5):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.limits = limits or {}
+        self.attempts = attempts
+        self.semaphores = {}
+        self.limiters = {}
+        self.hosts_lock = threading.Lock()
+        super().__init__(pool_connections=connections, pool_maxsize=connections, max_retries=retries)
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        with self.hosts_lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.concurrency)
+                self.limiters[host] = WriteLimiter(**self.limits)
+            return self.semaphores[host], self.limiters[host]
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        semaphore, limiter = self._host(request.url)
+        write = is_write(request)
+        attempt = 0
+        while True:
+            if write:
+                limiter.acquire()
+            else:
+                limiter.wait()
+            with semaphore:
+                response = super().send(request, **kwargs)
+            delay, reason = slow_down(response, write)
+            if delay is None:
+                if write:
+                    limiter.success()
+                return response
+            limiter.slow_down(delay, reason)
+            attempt = attempt + 1
+            if attempt > self.attempts:
+                return response
+            print("The server asked to slow down (", reason, "), sending again in", delay, "s")
+            response.close()
+
+    # the edit rate of the hosts that were edited
+    def report(self):
+        with self.hosts_lock:
+            limiters = dict(self.limiters)
+        return "; ".join(host + " " + limiter.report() for host, limiter in limiters.items() if limiter.edits > 0)
+
+
+def is_write(request):
+    if request.method != 'POST' or request.body is None:
+        return False
+    body = request.body
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    return isinstance(body, str) and WRITE_ACTIONS.search(body) is not None
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return DEFAULT_DELAY
+
+
+# the number of seconds to wait and why when the server asks to slow down, (None, None) otherwise; the body is only
+# read for the edits, the other responses can be streamed
+def slow_down(response, write):
+    if response.status_code in (429, 503):
+        return _retry_after(response), 'http ' + str(response.status_code)
+    # maxlag errors come with the lag in a header
+    if 'X-Database-Lag' in response.headers:
+        return _retry_after(response), 'maxlag'
+    if write and b'"error"' in response.content:
+        try:
+            code = json.loads(response.content.decode('utf-8')).get('error', {}).get('code')
+        except ValueError:
+            return None, None
+        if code in ('maxlag', 'ratelimited'):
+            return _retry_after(response), code
+    return None, None
+
+
+_session = None
+_lock = threading.Lock()
+
+
+def _adapter():
+    app_config = configparser.ConfigParser()
+    app_config.read('config/application.config.ini')
+    limits = {'rate': app_config.getfloat('http', 'edit_rate', fallback=5),
+              'min_rate': app_config.getfloat('http', 'min_edit_rate', fallback=0.2),
+              'max_rate': app_config.getfloat('http', 'max_edit_rate', fallback=50),
+              'burst': app_config.getint('http', 'edit_burst', fallback=5)}
+    return PooledAdapter(app_config.getint('http', 'connections', fallback=10),
+                         app_config.getint('http', 'concurrency', fallback=8),
+                         app_config.getint('http', 'retries', fallback=3),
+                         app_config.getint('http', 'timeout', fallback=60),
+                         limits, app_config.getint('http', 'attempts', fallback=5))
+
+
+def mount(session, adapter):
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    session.headers['Connection'] = 'keep-alive'
+
+
+# the shared session, created at the first use
+def session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = requests.Session()
+            mount(_session, _adapter())
+        return _session
+
+
+# the edit rate and the time spent waiting, for every wiki that was edited
+def edit_report():
+    return session().get_adapter('https://').report()
+
+
+# pywikibot sends all its requests through its own session, it gets the pooled adapter of the shared one
+def share_with_pywikibot():
+    from pywikibot.comms import http
+    shared = session()
+    if getattr(http, 'session', None) is not None and http.session is not shared:
+        mount(http.session, shared.get_adapter('https://'))
+
+
+# the results of a SPARQL select query, as returned by the endpoint in the JSON format
+def sparql_select(endpoint, query):
+    response = session().post(endpoint, data={'query': query},
+                              headers={'Accept': 'application/sparql-results+json'})
+    response.raise_for_status()
+    return response.json()
+
+
+# the response of a SPARQL select query in the CSV format, streamed: it has to be closed
+def sparql_csv(endpoint, query):
+    response = session().post(endpoint, data={'query': query}, headers={'Accept': 'text/csv'}, stream=True)
+    try:
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+    return response
+
+
+# the lines of a streamed response with their line ends, decoded while the body is downloaded, e.g. for csv.reader;
+# once they are all read, closing the response gives the connection back to the pool
+def text_lines(response, encoding='utf-8', chunk_size=65536):
+    decoder = codecs.getincrementaldecoder(encoding)()
+    rest = ''
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        lines = (rest + decoder.decode(chunk)).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    rest = rest + decoder.decode(b'', final=True)
+    if rest:
+        yield rest
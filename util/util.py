@@ -1,27 +1,109 @@
 import re
 from decimal import Decimal
 import json
+import threading
 import pywikibot
 from pywikibot.page import Claim
 import configparser
 
 from util.IdSparql import IdSparql
 from util.PropertyWikidataIdentifier import PropertyWikidataIdentifier
+from util.sync_pool import EntityLocks
+from util.entity_fetcher import EntityFetcher, referenced_ids, globe_ids
+from util.fingerprint import WikidataStatement, WikibaseStatement, index_statements
+from util.revision_history import RevisionCache, RevisionHistory
+from util.revision_tracker import revision_tracker
+from util.property_metadata import PropertyMetadata
+from util.support_entities import SupportEntities
+from util.json_diff import JsonDiff
+from util.translation_pool import TranslationPool, claim_count
+from util.transport import share_with_pywikibot
 
 languages = ["bg", "cs", "da", "de", "el", "en", "es", "et", "fi", "fr", "ga", "hr", "hu", "it", "lb", "lt", "lv", "mt",
              "nl", "pl", "pt", "ro", "sk", "sl", "sv", "tr"]
+# for the lookups
+language_set = frozenset(languages)
+
+
+# the terms of one kind (labels, descriptions or aliases, by language) of a wikidata page in the synchronized languages
+# that the wikibase page does not have or has with another value; exists is False for a page that is not created yet
+def diff_terms(wikidata_terms, wikibase_terms, exists):
+    changed = {}
+    for language in wikidata_terms:
+        if language in language_set:
+            if not exists or language not in wikibase_terms or \
+                    wikidata_terms.get(language) != wikibase_terms.get(language):
+                changed[language] = wikidata_terms.get(language)
+    return changed
 
 class WikibaseImporter:
     def __init__(self, wikibase_repo, wikidata_repo):
         self.wikibase_repo = wikibase_repo
         self.wikidata_repo = wikidata_repo
+        # the api requests of pywikibot go through the pooled connections of the other clients
+        share_with_pywikibot()
         self.identifier = PropertyWikidataIdentifier()
         self.identifier.get(wikibase_repo)
-        appConfig = configparser.ConfigParser()
-        appConfig.read('config/application.config.ini')
-        endpoint = appConfig.get('wikibase','sparqlEndPoint')
+        self.app_config = configparser.ConfigParser()
+        self.app_config.read('config/application.config.ini')
+        endpoint = self.app_config.get('wikibase','sparqlEndPoint')
         self.id = IdSparql(endpoint, self.identifier.itemIdentifier, self.identifier.propertyIdentifier)
         self.id.load()
+        self.locks = EntityLocks()
+        # the entities whose last sync could not save all the changes
+        self.failures = set()
+        self.failures_lock = threading.Lock()
+        self.fetcher = EntityFetcher(wikidata_repo)
+        # the parsed revisions of the wikibase entities, shared by the threads
+        self.revision_cache = RevisionCache(
+            self.app_config.getint('sync', 'revision_cache_mb', fallback=64) * 1024 * 1024)
+        # the wikidata revisions the entities were last synchronized from, None if they are not tracked
+        self.revisions = revision_tracker(self.app_config)
+        # the datatypes of the mapped properties on both sides
+        self.properties = PropertyMetadata(self.app_config.get('mapping', 'properties', fallback=''))
+        self.properties.load_later(self.id.mapProperty, wikidata_repo, wikibase_repo)
+        # all the changes of an entity with one edit instead of one edit per kind of change
+        self.single_edit = self.app_config.getboolean('sync', 'single_edit', fallback=False)
+        # larger edits are split, the added claims are sent by 20
+        self.max_edit_size = self.app_config.getint('sync', 'max_edit_size', fallback=1000000)
+        # the globes and units claims refer to, synchronized once every support_ttl seconds
+        self.support = SupportEntities(self, self.app_config.getint('sync', 'support_ttl', fallback=3600))
+        # diffs the raw json of the entities, used for the removed claims and by the json engine
+        self.json_diff = JsonDiff(self.id, languages, self.identifier.itemIdentifier, wikibase_repo.concept_base_uri,
+                                  self.properties, self.identifier.propertyIdentifier, self.support)
+        # json: in single edit mode the changes are computed on the raw json of both entities, without pywikibot pages
+        self.engine = self.app_config.get('sync', 'engine', fallback='pywikibot')
+        # the json of the entities with at least large_entity claims is diffed by a pool of processes
+        self.large_entity = self.app_config.getint('sync', 'large_entity', fallback=500)
+        self.translation_pool = None
+        processes = self.app_config.getint('sync', 'processes', fallback=0)
+        if processes > 0 and self.engine == 'json':
+            self.translation_pool = TranslationPool(self.id, self.properties, languages, self.identifier.itemIdentifier,
+                                                    self.identifier.propertyIdentifier,
+                                                    wikibase_repo.concept_base_uri, processes)
+
+    # synchronizes the [sync] support entities (none by default) at the start of the scripts that sync many entities,
+    # the others resolve them when a claim first refers to them
+    def presync_support(self):
+        support = self.app_config.get('sync', 'support', fallback='')
+        ids = [id.strip() for id in support.split(',') if id.strip() != '']
+        if len(ids) > 0:
+            self.support.presync(ids)
+
+    # loads the given wikidata entities, and the entities their claims refer to that translateClaim needs, with
+    # batched wbgetentities requests
+    def prefetch(self, ids):
+        self.fetcher.prefetch(ids)
+        needed = set()
+        for id in ids:
+            json_object = self.fetcher.get_json(id)
+            if json_object is not None:
+                for referenced_id in referenced_ids(json_object):
+                    if not self.id.contains_id(referenced_id):
+                        needed.add(referenced_id)
+                # globes are changed even if they exist, unless they were changed recently
+                needed.update(id for id in globe_ids(json_object) if not self.support.is_fresh(id))
+        self.fetcher.prefetch(needed)
 
     # transforms the json to an item
     def jsonToItem(self, wikibase_repo, json_object):
@@ -70,19 +152,9 @@ class WikibaseImporter:
 
     # comparing the labels
     def diffLabels(self, wikidata_item, wikibase_item):
-        mylabels = {}
-        for label in wikidata_item.labels:
-            if label in languages:
-                # if label != "nqo":
-                if wikibase_item.getID() != str(-1) and label in wikibase_item.labels:
-                    # print(wikidata_item.labels.get(label), "----", wikibase_item.labels.get(label), "---", wikidata_item.labels.get(label) == wikibase_item.labels.get(label))
-                    if not (wikidata_item.labels.get(label) == wikibase_item.labels.get(label)):
-                        # print("Change", wikidata_item.labels.get(label), "----", wikibase_item.labels.get(label))
-                        mylabels[label] = wikidata_item.labels.get(label)
-                else:
-                    mylabels[label] = wikidata_item.labels.get(label)
-        return mylabels
+        return diff_terms(wikidata_item.labels, wikibase_item.labels, wikibase_item.getID() != str(-1))
 
+    # the write methods return False if the edit failed, True if it was saved or there was nothing to change
     def changeLabels(self, wikidata_item, wikibase_item):
         mylabels = self.diffLabels(wikidata_item, wikibase_item)
         if len(mylabels) != 0:
@@ -90,30 +162,21 @@ class WikibaseImporter:
             # wikibase_item.editLabels(mylabels, summary=u'Label in wikidata changed')
             try:
                 wikibase_item.editLabels(mylabels, summary=u'Label in wikidata changed')
-                return wikibase_item.getID()
             except pywikibot.exceptions.OtherPageSaveError as e:
                 print("Could not set labels of ", wikibase_item.getID())
                 print(e)
                 # this happens when a property with the same label already exists
                 x = re.search(r"\[\[Property:.*\]\]", str(e))
                 if x:
-                    return x.group(0).replace("[[Property:", "").split("|")[0]
+                    print("The label is used by ", x.group(0).replace("[[Property:", "").split("|")[0])
                 else:
                     print("This should not happen 3")
+                return False
+        return True
 
     # comparing the descriptions
     def diffDescriptions(self, wikidata_item, wikibase_item):
-        myDescriptions = {}
-        for description in wikidata_item.descriptions:
-            if description in languages:
-                if wikibase_item.getID() != str(-1) and description in wikibase_item.descriptions:
-                    if not (wikidata_item.descriptions.get(description) == wikibase_item.descriptions.get(
-                            description)):
-                        # print("Change", wikidata_item.descriptions.get(description), "----", wikibase_item.descriptions.get(description))
-                        myDescriptions[description] = wikidata_item.descriptions.get(description)
-                else:
-                    myDescriptions[description] = wikidata_item.descriptions.get(description)
-        return myDescriptions
+        return diff_terms(wikidata_item.descriptions, wikibase_item.descriptions, wikibase_item.getID() != str(-1))
 
     # comparing the descriptions
     def change_descriptions(self, wikidata_item, wikibase_item):
@@ -129,23 +192,16 @@ class WikibaseImporter:
                 print(e)
                 x = re.search(r'\[\[Item:.*\]\]', str(e))
                 if x:
-                    return x.group(0).replace("[[Item:", "").split("|")[0]
+                    print("The description is used by ", x.group(0).replace("[[Item:", "").split("|")[0])
                 else:
                     print("This should not happen 4")
                 print("Error probably property or item already existing ", e)
+                return False
+        return True
 
     # diff the aliases
     def diffAliases(self, wikidata_item, wikibase_item):
-        mylabels = {}
-        for alias in wikidata_item.aliases:
-            if alias in languages:
-                if wikibase_item.getID() != str(-1) and alias in wikibase_item.aliases:
-                    if not (wikidata_item.aliases.get(alias) == wikibase_item.aliases.get(alias)):
-                        # print("Change", wikidata_item.aliases.get(alias), "----", wikibase_item.aliases.get(alias))
-                        mylabels[alias] = wikidata_item.aliases.get(alias)
-                else:
-                    mylabels[alias] = wikidata_item.aliases.get(alias)
-        return mylabels
+        return diff_terms(wikidata_item.aliases, wikibase_item.aliases, wikibase_item.getID() != str(-1))
 
     # comparing the aliases
     def changeAliases(self, wikidata_item, wikibase_item):
@@ -156,6 +212,8 @@ class WikibaseImporter:
                 wikibase_item.editAliases(myaliases, summary=u'Aliases in wikidata changed')
             except pywikibot.exceptions.OtherPageSaveError as e:
                 print("This should not happen ", e)
+                return False
+        return True
 
     # comparing the sitelinks
     def diffSiteLinks(self, wikidata_item, wikibase_item):
@@ -190,73 +248,84 @@ class WikibaseImporter:
             except pywikibot.exceptions.OtherPageSaveError as e:
                 print("Could not set sitelinks of ", wikibase_item.getID())
                 print(e)
+                return False
             except pywikibot.exceptions.UnknownSite as e:
                 print("Could not set sitelinks of ", wikibase_item.getID())
                 print(e)
+                return False
+        return True
 
     def importItem(self, wikidata_item):
-        print("Import Entity", wikidata_item.getID() + " from Wikidata")
-        wikibase_item = pywikibot.ItemPage(self.wikibase_repo)
-        mylabels = self.diffLabels(wikidata_item, wikibase_item)
-        myDescriptions = self.diffDescriptions(wikidata_item, wikibase_item)
-        myaliases = self.diffAliases(wikidata_item, wikibase_item)
-        # mySitelinks = diffSiteLinks(wikidata_item, wikibase_item)
-        mySitelinks = [];
-        claim = pywikibot.page.Claim(self.wikibase_repo, self.identifier.itemIdentifier, datatype='external-id')
-        target = wikidata_item.getID()
-        claim.setTarget(target)
-        data = {
-            'labels': mylabels,
-            'descriptions': myDescriptions,
-            'aliases': myaliases,
-            'sitelinks': mySitelinks,
-            'claims': [claim.toJSON()]
-        }
-        # print(data)
-        try:
-            wikibase_item.editEntity(data, summary=u'Importing entity ' + wikidata_item.getID() + ' from wikidata')
-            self.id.save_id(wikidata_item.getID(), wikibase_item.getID())
-            return wikibase_item.getID()
-        except pywikibot.exceptions.OtherPageSaveError as e:
-            print("Could not set description of ", wikibase_item.getID())
-            print("This is the error message ", e)
-            x = re.search(r'\[\[Item:.*\]\]', str(e))
-            if x:
-                return x.group(0).replace("[[Item:", "").split("|")[0]
-            else:
-                print("This should not happen 5")
-            print("Error probably property or item already existing ", e)
+        # two workers must not create the same item
+        with self.locks.hold('import ' + wikidata_item.getID(), leaf=True):
+            if self.id.contains_id(wikidata_item.getID()):
+                return self.id.get_id(wikidata_item.getID())
+            print("Import Entity", wikidata_item.getID() + " from Wikidata")
+            wikibase_item = pywikibot.ItemPage(self.wikibase_repo)
+            mylabels = self.diffLabels(wikidata_item, wikibase_item)
+            myDescriptions = self.diffDescriptions(wikidata_item, wikibase_item)
+            myaliases = self.diffAliases(wikidata_item, wikibase_item)
+            # mySitelinks = diffSiteLinks(wikidata_item, wikibase_item)
+            mySitelinks = [];
+            claim = pywikibot.page.Claim(self.wikibase_repo, self.identifier.itemIdentifier, datatype='external-id')
+            target = wikidata_item.getID()
+            claim.setTarget(target)
+            data = {
+                'labels': mylabels,
+                'descriptions': myDescriptions,
+                'aliases': myaliases,
+                'sitelinks': mySitelinks,
+                'claims': [claim.toJSON()]
+            }
+            # print(data)
+            try:
+                wikibase_item.editEntity(data, summary=u'Importing entity ' + wikidata_item.getID() + ' from wikidata')
+                self.id.save_id(wikidata_item.getID(), wikibase_item.getID())
+                return wikibase_item.getID()
+            except pywikibot.exceptions.OtherPageSaveError as e:
+                print("Could not set description of ", wikibase_item.getID())
+                print("This is the error message ", e)
+                x = re.search(r'\[\[Item:.*\]\]', str(e))
+                if x:
+                    return x.group(0).replace("[[Item:", "").split("|")[0]
+                else:
+                    print("This should not happen 5")
+                print("Error probably property or item already existing ", e)
 
     def importProperty(self, wikidata_item):
-        print("Import Property", wikidata_item.getID() + " from Wikidata")
-        wikibase_item = pywikibot.PropertyPage(self.wikibase_repo, datatype=wikidata_item.type)
-        mylabels = self.diffLabels(wikidata_item, wikibase_item)
-        myDescriptions = self.diffDescriptions(wikidata_item, wikibase_item)
-        myaliases = self.diffAliases(wikidata_item, wikibase_item)
-        claim = pywikibot.page.Claim(self.wikibase_repo, self.identifier.propertyIdentifier, datatype='external-id')
-        target = wikidata_item.getID()
-        claim.setTarget(target)
-
-        data = {
-            'labels': mylabels,
-            'descriptions': myDescriptions,
-            'aliases': myaliases,
-            'claims': [claim.toJSON()]
-        }
-        try:
-            wikibase_item.editEntity(data,
-                                     summary=u'Importing property ' + wikidata_item.getID() + ' from wikidata')
-            self.id.save_id(wikidata_item.getID(), wikibase_item.getID())
-            return wikibase_item.getID()
-        except pywikibot.exceptions.OtherPageSaveError as e:
-            print("Could not set description of ", wikibase_item.getID())
-            print(e)
-            x = re.search(r'\[\[Item:.*\]\]', str(e))
-            if x:
-                return x.group(0).replace("[[Item:", "").split("|")[0]
-            else:
-                print("This should not happen 6")
-            print("Error probably property or item already existing ", e)
+        with self.locks.hold('import ' + wikidata_item.getID(), leaf=True):
+            if self.id.contains_id(wikidata_item.getID()):
+                return self.id.get_id(wikidata_item.getID())
+            print("Import Property", wikidata_item.getID() + " from Wikidata")
+            wikibase_item = pywikibot.PropertyPage(self.wikibase_repo, datatype=wikidata_item.type)
+            mylabels = self.diffLabels(wikidata_item, wikibase_item)
+            myDescriptions = self.diffDescriptions(wikidata_item, wikibase_item)
+            myaliases = self.diffAliases(wikidata_item, wikibase_item)
+            claim = pywikibot.page.Claim(self.wikibase_repo, self.identifier.propertyIdentifier, datatype='external-id')
+            target = wikidata_item.getID()
+            claim.setTarget(target)
+
+            data = {
+                'labels': mylabels,
+                'descriptions': myDescriptions,
+                'aliases': myaliases,
+                'claims': [claim.toJSON()]
+            }
+            try:
+                wikibase_item.editEntity(data,
+                                         summary=u'Importing property ' + wikidata_item.getID() + ' from wikidata')
+                self.id.save_id(wikidata_item.getID(), wikibase_item.getID())
+                self.properties.put(wikidata_item.getID(), wikidata_item.type, wikibase_item.getID(), wikidata_item.type)
+                return wikibase_item.getID()
+            except pywikibot.exceptions.OtherPageSaveError as e:
+                print("Could not set description of ", wikibase_item.getID())
+                print(e)
+                x = re.search(r'\[\[Item:.*\]\]', str(e))
+                if x:
+                    return x.group(0).replace("[[Item:", "").split("|")[0]
+                else:
+                    print("This should not happen 6")
+                print("Error probably property or item already existing ", e)
 
     # comparing two claims
     def compare_claim(self, wikidata_claim, wikibase_claim, translate):
@@ -520,10 +589,14 @@ class WikibaseImporter:
     def translateClaim(self, wikidata_claim):
         wikidata_propertyId = wikidata_claim.get('property')
         if not self.id.contains_id(wikidata_propertyId):
-            wikidata_property = pywikibot.PropertyPage(self.wikidata_repo, wikidata_propertyId,
-                                                       datatype=wikidata_claim.get('datatype'))
-            wikidata_property.get()
+            wikidata_property = self.fetcher.get(wikidata_propertyId)
             self.importProperty(wikidata_property)
+        # a value of the wikidata datatype cannot be set to a wikibase property of another datatype
+        wikibase_datatype = self.properties.wikibase_datatype(wikidata_propertyId)
+        if wikibase_datatype is not None and wikidata_claim.get('datatype') not in (None, wikibase_datatype):
+            print("The property ", wikidata_propertyId, " has the datatype ", wikibase_datatype, " in wikibase and ",
+                  wikidata_claim.get('datatype'), " in wikidata")
+            return None
         if wikidata_claim.get('snaktype') == 'somevalue':
             claim = pywikibot.Claim(self.wikibase_repo, self.id.get_id(wikidata_propertyId),
                                     datatype=wikidata_claim.get('datatype'))
@@ -540,9 +613,8 @@ class WikibaseImporter:
                 wikidata_objectId = 'Q' + str(
                     wikidata_claim.get('datavalue').get('value').get('numeric-id'))
                 if not self.id.contains_id(wikidata_objectId):
-                    item = pywikibot.ItemPage(self.wikidata_repo, wikidata_objectId)
                     try:
-                        item.get()
+                        item = self.fetcher.get(wikidata_objectId)
                         self.importItem(item)
                     except pywikibot.exceptions.IsRedirectPage:
                         print("We are ignoring this")
@@ -558,9 +630,8 @@ class WikibaseImporter:
                 wikidata_objectId = 'P' + str(
                     wikidata_claim.get('datavalue').get('value').get('numeric-id'))
                 if not self.id.contains_id(wikidata_objectId):
-                    item = pywikibot.PropertyPage(self.self.wikibase_repo, wikidata_objectId)
                     try:
-                        item.get()
+                        item = self.fetcher.get(wikidata_objectId)
                         self.importProperty(item)
                     except pywikibot.exceptions.IsRedirectPage:
                         print("We are ignoring this")
@@ -589,26 +660,24 @@ class WikibaseImporter:
                 wikidata_latitude = wikidata_claim.get('datavalue').get('value').get('latitude')
                 wikidata_longitude = wikidata_claim.get('datavalue').get('value').get('longitude')
                 wikidata_altitude = wikidata_claim.get('datavalue').get('value').get('altitude')
-                wikidata_globe_uri = wikidata_claim.get('datavalue').get('value').get(
-                    'globe').replace("http://www.wikidata.org/entity/", "")
+                wikidata_globe_uri = (wikidata_claim.get('datavalue').get('value').get('globe') or
+                                      "http://www.wikidata.org/entity/Q2").replace("http://www.wikidata.org/entity/", "")
                 wikidata_precision = wikidata_claim.get('datavalue').get('value').get('precision')
-                wikidata_globe_item = pywikibot.ItemPage(self.wikidata_repo, wikidata_globe_uri)
-                wikidata_globe_item.get()
-                wikibase_globe_item = self.change_item(wikidata_globe_item, self.wikibase_repo, False)
+                # the globe is synchronized, the coordinate keeps the wikidata uri of its globe as wikibases do
+                globe_uri = self.support.globe_uri(wikidata_globe_uri)
 
-                ##Note: picking as globe wikidata item for earth, this is the standard in a wikibase even if the entity does not exist
                 claim = pywikibot.page.Claim(self.wikibase_repo, self.id.get_id(wikidata_propertyId),
                                              datatype='globe-coordinate')
                 if wikidata_precision != None:
                     target = pywikibot.Coordinate(site=self.wikibase_repo, lat=wikidata_latitude, lon=wikidata_longitude,
                                                   alt=wikidata_altitude,
-                                                  globe_item="http://www.wikidata.org/entity/Q2",
+                                                  globe_item=globe_uri,
                                                   precision=wikidata_precision
                                                   )
                 else:
                     target = pywikibot.Coordinate(site=self.wikibase_repo, lat=wikidata_latitude, lon=wikidata_longitude,
                                                   alt=wikidata_altitude,
-                                                  globe_item="http://www.wikidata.org/entity/Q2",
+                                                  globe_item=globe_uri,
                                                   precision=1
                                                   )
                 # print(wikidata_propertyId)
@@ -674,9 +743,7 @@ class WikibaseImporter:
                 wikidata_objectId = wikidata_unit.replace("http://www.wikidata.org/entity/", "")
                 # add unit if not in the wiki
                 if not (wikidata_unit == None or wikidata_unit == '1'):
-                    if not self.id.contains_id(wikidata_objectId):
-                        item = pywikibot.ItemPage(self.wikidata_repo, wikidata_objectId)
-                        self.change_item(item, self.wikibase_repo, False)
+                    self.support.resolve(wikidata_objectId, update=False)
                 claim = pywikibot.page.Claim(self.wikibase_repo, self.id.get_id(wikidata_propertyId),
                                              datatype='quantity')
                 # print(wikidata_amount)
@@ -859,100 +926,7 @@ class WikibaseImporter:
 
     # change the claims
     def changeClaims(self, wikidata_item, wikibase_item):
-        # check which claims are in wikibase and in wikidata with the same property but different value, and delete them
-        claimsToRemove = []
-        claim_more_accurate = []
-        for wikibase_claims in wikibase_item.claims:
-            for wikibase_c in wikibase_item.claims.get(wikibase_claims):
-                # print("Trying to find this claim ", wikibase_c)
-                alreadyFound = False
-                wikibase_claim = wikibase_c.toJSON()
-                wikibase_propertyId = wikibase_claim.get('mainsnak').get('property')
-                found = False
-                found_equal_value = False
-                found_more_accurate = False  # tells if the statement to import is better then the existing one, i.e. if it has references and qualifiers for the fact
-                for claims in wikidata_item.claims:
-                    for c in wikidata_item.claims.get(claims):
-                        wikidata_claim = c.toJSON()
-                        wikidata_propertyId = wikidata_claim.get('mainsnak').get('property')
-                        # if the property is not there then they cannot be at the same time in wikibase and wikidata
-                        if self.id.contains_id(wikidata_propertyId):
-                            if self.id.get_id(wikidata_propertyId) == wikibase_propertyId:
-
-                                # if wikidata_propertyId == 'P2884':
-
-                                # if self.id.get_id(wikidata_propertyId) == 'P194' and wikidata_propertyId == "P530":
-                                # print(wikidata_claim,"---",wikibase_claim)
-                                (found_here, found_equal_value_here,
-                                 more_accurate_here) = self.compare_claim_with_qualifiers_and_references(wikidata_claim,
-                                                                                                    wikibase_claim,
-                                                                                                    True)
-                                # print('Result ',found_here,found_equal_value_here, more_accurate_here)
-                                if found_here == True:
-                                    found = True
-                                if found_equal_value == True and found_equal_value_here == True:
-                                    alreadyFound = True
-                                if found_equal_value_here == True:
-                                    found_equal_value = True
-                                found_more_accurate = more_accurate_here
-
-                if found == True and found_equal_value == False:
-                    claimsToRemove.append(wikibase_c)
-                    claim_more_accurate.append(found_more_accurate)
-                    print("This claim is deleted ", wikibase_claim)
-                if alreadyFound == True:
-                    claimsToRemove.append(wikibase_c)
-                    claim_more_accurate.append(found_more_accurate)
-                    print("This claim is deleted it's a duplicate", wikibase_claim)
-
-        # print("CHECK WHO ADDED THE CLAIMS")
-        # check that the claims to delete where added by Wikidata Updater, if not, don't delete them
-        # get all the edit history
-        not_remove = []
-        revisions_tmp = wikibase_item.revisions(content=True)
-        revisions = []
-        # problem with the revisions_tmp object
-        for h in revisions_tmp:
-            revisions.append(h)
-        is_only_wikidata_updater_user = True
-        # if only the wikidata updater made changes then it is for sure a deletion in wikidata
-        for revision in revisions:
-            # print(revision['user'])
-            if revision['user'] != "WikidataUpdater":
-                is_only_wikidata_updater_user = False
-                break
-        # print("is_only_wikidata_updater_user",is_only_wikidata_updater_user)
-        if not is_only_wikidata_updater_user:
-            for i in range(0, len(claimsToRemove)):
-                claimToRemove = claimsToRemove[i]
-                # print("CHECKING CLAIM ",claimToRemove, "---", claim_more_accurate[i],"---", revisions)
-                # go through the history and find the edit where it was added and the user that made that edit
-                if claim_more_accurate[
-                    i] == False:  # if the claim is more accurate it is better to cancel the existing one
-                    edit_where_claim_was_added = len(revisions) - 1
-                    for i in range(0, len(revisions)):
-                        # print("new revision ",revisions[i]['user'])
-                        item_revision = self.jsonToItem(self.wikibase_repo, revisions[i]['text'])
-                        found = False
-                        for claims_revision in item_revision['claims']:
-                            if found == False:
-                                for c_revision in item_revision['claims'].get(claims_revision):
-                                    if found == False:
-                                        (found_here, found_equal_value_here,
-                                         more_accurate) = self.compare_claim_with_qualifiers_and_references(
-                                            claimToRemove.toJSON(), c_revision.toJSON(), False)
-                                        # print(claimToRemove.toJSON(), "----", c_revision.toJSON())
-                                        # print("found_equal_value_here",found_equal_value_here, " more_accurate", more_accurate)
-                                        if found_equal_value_here == True:
-                                            found = True
-                        if found == False:
-                            edit_where_claim_was_added = i - 1
-                            break
-                    # print("User that added this claim ", revisions[edit_where_claim_was_added]['user'])
-                    if revisions[edit_where_claim_was_added]['user'] != appConfig.get('wikibase','user'):
-                        not_remove.append(claimToRemove)
-        for c in not_remove:
-            claimsToRemove.remove(c)
+        claimsToRemove = self.claims_to_remove(wikidata_item, wikibase_item)
         print("claimsToRemove ", claimsToRemove)
         if len(claimsToRemove) > 0:
             for claimsToRemoveChunk in chunks(claimsToRemove, 50):
@@ -966,7 +940,68 @@ class WikibaseImporter:
         else:
             wikibase_item = pywikibot.PropertyPage(self.wikibase_repo, wikibase_item.getID())
         wikibase_item.get()
+        newClaims = self.claims_to_add(wikidata_item, wikibase_item)
+        print("claimsToAdd ", newClaims)
+        saved = True
+        if len(newClaims) > 0:
+            for claimsToAdd in chunks(newClaims, 20):
+                data = {}
+                data['claims'] = claimsToAdd
+
+                import json
+                print("Data ", json.dumps(data))
+                try:
+                    wikibase_item.editEntity(data,
+                                             summary="Adding these statements since they where added in Wikidata")
+                except (pywikibot.data.api.APIError, pywikibot.exceptions.OtherPageSaveError) as e:
+                    print(e)
+                    saved = False
+        return saved
+
+    # the wikibase claims that are not in wikidata anymore
+    def claims_to_remove(self, wikidata_item, wikibase_item):
+        # check which claims are in wikibase and in wikidata with the same property but different value, and delete them
+        wikidata_claims = [c.toJSON() for claims in wikidata_item.claims for c in wikidata_item.claims.get(claims)]
+        wikibase_claims = [c for claims in wikibase_item.claims for c in wikibase_item.claims.get(claims)]
+        wikibase_claims_json = [c.toJSON() for c in wikibase_claims]
+        claims = dict((id(wikibase_claim), wikibase_c) for wikibase_claim, wikibase_c in
+                      zip(wikibase_claims_json, wikibase_claims))
+        removals = self.json_diff.removals(wikidata_claims, wikibase_claims_json)
+        for wikibase_claim, found_more_accurate in removals:
+            print("This claim is deleted ", wikibase_claim)
+        return [claims[id(wikibase_claim)] for wikibase_claim, found_more_accurate in
+                self.removals_added_by_us(wikibase_item, removals)]
+
+    # check that the claims to delete where added by Wikidata Updater, if not, don't delete them
+    def removals_added_by_us(self, wikibase_item, removals):
+        if len(removals) == 0:
+            return removals
+        # get all the edit history
+        history = RevisionHistory(self.wikibase_repo, wikibase_item, self.revision_cache)
+        # if only the wikidata updater made changes then it is for sure a deletion in wikidata
+        is_only_wikidata_updater_user = all(user == "WikidataUpdater" for user in history.users())
+        if is_only_wikidata_updater_user:
+            return removals
+        # if the claim is more accurate it is better to cancel the existing one
+        candidates = [wikibase_claim for wikibase_claim, found_more_accurate in removals if
+                      found_more_accurate == False]
+        # go through the history once and find for every claim the edit where it was added and the user that made
+        # that edit
+        added_in = history.added_in(candidates, self.properties.wikibase_datatypes())
+        not_remove = set(id(wikibase_claim) for wikibase_claim, edit_where_claim_was_added in zip(candidates, added_in)
+                         if history.user(edit_where_claim_was_added) != self.app_config.get('wikibase', 'user'))
+        return [removal for removal in removals if id(removal[0]) not in not_remove]
+
+    # the translated json of the wikidata claims that are not in wikibase, without counting the removed wikibase claims
+    def claims_to_add(self, wikidata_item, wikibase_item, removed=()):
+        removed = set(id(c) for c in removed)
         newClaims = []
+        wikibase_statements = []
+        for wikibase_claims in wikibase_item.claims:
+            for wikibase_c in wikibase_item.claims.get(wikibase_claims):
+                if id(wikibase_c) not in removed:
+                    wikibase_statements.append(WikibaseStatement(wikibase_c.toJSON(), wikibase_c))
+        wikibase_statements_by_value = index_statements(wikibase_statements)
         for claims in wikidata_item.claims:
             for c in wikidata_item.claims.get(claims):
                 wikidata_claim = c.toJSON()
@@ -974,14 +1009,12 @@ class WikibaseImporter:
                 wikidata_propertyId = wikidata_claim.get('mainsnak').get('property')
                 print(wikidata_propertyId)
                 if wikibase_item.getID().startswith("Q") or wikibase_item.getID().startswith("P"):
-                    for wikibase_claims in wikibase_item.claims:
-                        for wikibase_c in wikibase_item.claims.get(wikibase_claims):
-                            wikibase_claim = wikibase_c.toJSON()
-                            if self.id.contains_id(wikidata_propertyId):
-                                (claim_found, claim_found_equal_value,
-                                 more_accurate) = self.compare_claim_with_qualifiers_and_references(wikidata_claim,
-                                                                                               wikibase_claim, True)
-                                if (claim_found_equal_value == True):
+                    # the fingerprint is computed here since translating the previous claims can import properties
+                    if self.id.contains_id(wikidata_propertyId):
+                        statement = WikidataStatement(wikidata_claim, self.id, c)
+                        for key in statement.index_keys():
+                            for wikibase_statement in wikibase_statements_by_value.get(key, []):
+                                if statement.equals(wikibase_statement):
                                     found_equal_value = True
                     print(found_equal_value)
                     if found_equal_value == False:
@@ -989,54 +1022,40 @@ class WikibaseImporter:
                         # import the property if it does not exist
                         if wikidata_claim.get('mainsnak').get('snaktype') == 'value':
                             # the claim is added
-                            claim = self.translateClaim(wikidata_claim.get('mainsnak'))
+                            claim = self.translate_full_claim(wikidata_claim)
                             if claim is not None:
-                                claim.setRank(wikidata_claim.get('rank'))
-                                if 'qualifiers' in wikidata_claim:
-                                    for key in wikidata_claim.get('qualifiers'):
-                                        for old_qualifier in wikidata_claim.get('qualifiers').get(key):
-                                            new_qualifier = self.translateClaim(old_qualifier)
-                                            if new_qualifier != None:
-                                                claim.addQualifier(new_qualifier)
-                                if 'references' in wikidata_claim:
-                                    for snak in wikidata_claim.get('references'):
-                                        for key in snak.get('snaks'):
-                                            new_references = []
-                                            for old_reference in snak.get('snaks').get(key):
-                                                # print('old',old_reference)
-                                                new_reference = self.translateClaim(old_reference)
-                                                # print(new_reference)
-                                                # this can happen if the object entity has no label in any given language
-                                                if new_reference != None:
-                                                    new_references.append(new_reference)
-                                            if len(new_references) > 0:
-                                                claim.addSources(new_references)
                                 newClaims.append(claim.toJSON())
-                                # print("wikidata claim ",wikidata_claim)
-                                # data = {}
-                                # data['claims'] = [claim.toJSON()]
-                                # print("Data ", json.dumps(data))
-                                # wikibase_item.editEntity(data)
-
                             else:
                                 print('The translated claim is None ', wikidata_claim.get('mainsnak'))
                         elif wikidata_claim.get('mainsnak').get('snaktype') == 'novalue':
                             print("Claims with no value not implemented yet")
                         else:
                             print('This should not happen ', wikidata_claim.get('mainsnak'))
-        print("claimsToAdd ", newClaims)
-        if len(newClaims) > 0:
-            for claimsToAdd in chunks(newClaims, 20):
-                data = {}
-                data['claims'] = claimsToAdd
+        return newClaims
 
-                import json
-                print("Data ", json.dumps(data))
-                try:
-                    wikibase_item.editEntity(data,
-                                             summary="Adding these statements since they where added in Wikidata")
-                except (pywikibot.data.api.APIError, pywikibot.exceptions.OtherPageSaveError) as e:
-                    print(e)
+    # translates a wikidata claim with its qualifiers and references
+    def translate_full_claim(self, wikidata_claim):
+        claim = self.translateClaim(wikidata_claim.get('mainsnak'))
+        if claim is not None:
+            claim.setRank(wikidata_claim.get('rank'))
+            if 'qualifiers' in wikidata_claim:
+                for key in wikidata_claim.get('qualifiers'):
+                    for old_qualifier in wikidata_claim.get('qualifiers').get(key):
+                        new_qualifier = self.translateClaim(old_qualifier)
+                        if new_qualifier != None:
+                            claim.addQualifier(new_qualifier)
+            if 'references' in wikidata_claim:
+                for snak in wikidata_claim.get('references'):
+                    for key in snak.get('snaks'):
+                        new_references = []
+                        for old_reference in snak.get('snaks').get(key):
+                            new_reference = self.translateClaim(old_reference)
+                            # this can happen if the object entity has no label in any given language
+                            if new_reference != None:
+                                new_references.append(new_reference)
+                        if len(new_references) > 0:
+                            claim.addSources(new_references)
+        return claim
 
     def wikidata_link(self, wikibase_item, wikidata_item):
         # make a link to wikidata if it does not exist
@@ -1053,62 +1072,277 @@ class WikibaseImporter:
             target = wikidata_item.getID()
             claim.setTarget(target)
             wikibase_item.addClaim(claim)
+        return True
+
+    # changes the terms (and the link to wikidata) and the statements (sitelinks and claims) of the wikibase entity,
+    # with one edit in single edit mode
+    def change_entity(self, wikidata_item, wikibase_item, terms, statements):
+        if not self.single_edit:
+            return self.change_step_by_step(wikidata_item, wikibase_item, terms, statements)
+        data = self.diffEntity(wikidata_item, wikibase_item, terms, statements)
+        return self.save_entity(wikidata_item, wikibase_item, data, terms, statements)
+
+    # saves the changes with one edit, or step by step if that edit fails; False if some changes could not be saved
+    def save_entity(self, wikidata_item, wikibase_item, data, terms, statements):
+        if len(data) == 0:
+            print("Nothing to change")
+            return True
+        print("Change in one edit ", list(data.keys()))
+        try:
+            if len(json.dumps(data)) <= self.max_edit_size:
+                wikibase_item.editEntity(data, summary="Synchronizing the changes in Wikidata")
+            else:
+                self.edit_in_chunks(wikibase_item, data)
+        except (pywikibot.data.api.APIError, pywikibot.exceptions.OtherPageSaveError,
+                pywikibot.exceptions.UnknownSite) as e:
+            # e.g. a label that another entity has already, the changes that can be done are done one after the other
+            print("Could not change ", wikibase_item.getID(), " in one edit ", e)
+            wikibase_item.get(force=True)
+            return self.change_step_by_step(wikidata_item, wikibase_item, terms, statements)
+        return True
+
+    # the json engine: the changes are computed on the raw json of both entities and saved with one edit; None if the
+    # json of the wikidata entity is not available or the wikibase entity is missing, then the pages are used, otherwise
+    # whether all the changes were saved
+    # the json of the wikibase entity is fetched unless it is given, e.g. prefetched with the batch
+    def change_entity_json(self, wikidata_item, wikibase_id, terms, statements, wikibase_json=None):
+        wikidata_json = getattr(wikidata_item, '_content', None)
+        if wikidata_json is None:
+            return None
+        if wikibase_json is None:
+            request = self.wikibase_repo.simple_request(action='wbgetentities', ids=wikibase_id)
+            wikibase_json = request.submit()['entities'].get(wikibase_id)
+        if wikibase_json is None or 'missing' in wikibase_json or wikibase_json.get('id') != wikibase_id:
+            return None
+        if wikibase_id.startswith("Q"):
+            wikibase_item = pywikibot.ItemPage(self.wikibase_repo, wikibase_id)
+        else:
+            wikibase_item = pywikibot.PropertyPage(self.wikibase_repo, wikibase_id,
+                                                   datatype=wikibase_json.get('datatype'))
+        data, removals, unresolved = self.diff_json(wikidata_json, wikibase_json, terms, statements, wikibase_item)
+        claims = data.get('claims', [])
+        if len(removals) > 0:
+            print("claimsToRemove ", [claim for claim, found_more_accurate in removals])
+            claims = [{'id': claim['id'], 'remove': ''} for claim, found_more_accurate in removals] + claims
+        # the claims that need pywikibot, e.g. to import the entities they refer to
+        for wikidata_claim in unresolved:
+            claim = self.translate_full_claim(wikidata_claim)
+            if claim is not None:
+                claims.append(claim.toJSON())
+        if len(claims) > 0:
+            data['claims'] = claims
+        # the edit fails if the entity changed since it was fetched
+        wikibase_item.latest_revision_id = wikibase_json.get('lastrevid')
+        return self.save_entity(wikidata_item, wikibase_item, data, terms, statements)
+
+    # JsonDiff.diff, in the translation processes for large entities; only the removals of claims added by us are kept
+    # and the missing claims are computed against them
+    def diff_json(self, wikidata_json, wikibase_json, terms, statements, wikibase_item):
+        def added_by_us(removals):
+            return self.removals_added_by_us(wikibase_item, removals)
+
+        if self.translation_pool is not None and statements and claim_count(wikidata_json) + claim_count(
+                wikibase_json) >= self.large_entity:
+            result = self.translation_pool.diff(wikidata_json, wikibase_json, terms, statements)
+            if result is not None:
+                data, removals, unresolved = result
+                # the translation processes do not synchronize the globes
+                for globe in globe_ids(wikidata_json):
+                    self.support.resolve(globe)
+                kept = added_by_us(removals)
+                if len(kept) == len(removals):
+                    return data, kept, unresolved
+                # some claims are not removed, the wikidata claims equal to them are not missing
+                kept = set(id(claim) for claim, found_more_accurate in kept)
+                return self.json_diff.diff(wikidata_json, wikibase_json, terms, statements,
+                                           lambda removals: [removal for removal in removals if id(removal[0]) in kept])
+        return self.json_diff.diff(wikidata_json, wikibase_json, terms, statements, added_by_us)
 
-    def change_item(self, wikidata_item, wikibase_repo, statements):
+    # every change is tried even if a previous one failed; False if one of them failed
+    def change_step_by_step(self, wikidata_item, wikibase_item, terms, statements):
+        saved = []
+        if terms:
+            saved.append(self.changeLabels(wikidata_item, wikibase_item))
+            saved.append(self.changeAliases(wikidata_item, wikibase_item))
+            saved.append(self.change_descriptions(wikidata_item, wikibase_item))
+            if isinstance(wikibase_item, pywikibot.ItemPage):
+                saved.append(self.wikidata_link(wikibase_item, wikidata_item))
+        if statements:
+            if isinstance(wikibase_item, pywikibot.ItemPage):
+                saved.append(self.changeSiteLinks(wikidata_item, wikibase_item))
+            saved.append(self.changeClaims(wikidata_item, wikibase_item))
+        return all(saved)
+
+    # all the changes as the data of one wbeditentity request, the removed claims are given by their id
+    def diffEntity(self, wikidata_item, wikibase_item, terms, statements):
+        data = {}
+        claims = []
+        if terms:
+            for key, diff in (('labels', self.diffLabels(wikidata_item, wikibase_item)),
+                              ('descriptions', self.diffDescriptions(wikidata_item, wikibase_item)),
+                              ('aliases', self.diffAliases(wikidata_item, wikibase_item))):
+                if len(diff) > 0:
+                    data[key] = diff
+            if isinstance(wikibase_item, pywikibot.ItemPage):
+                # make a link to wikidata if it does not exist
+                if len(wikibase_item.claims.get(self.identifier.itemIdentifier, [])) == 0:
+                    claim = pywikibot.page.Claim(self.wikibase_repo, self.identifier.itemIdentifier,
+                                                 datatype='external-id')
+                    claim.setTarget(wikidata_item.getID())
+                    claims.append(claim.toJSON())
+        if statements:
+            if isinstance(wikibase_item, pywikibot.ItemPage):
+                siteLinks = self.diffSiteLinks(wikidata_item, wikibase_item)
+                if len(siteLinks) > 0:
+                    data['sitelinks'] = dict((siteLink['site'], siteLink) for siteLink in siteLinks)
+            claimsToRemove = self.claims_to_remove(wikidata_item, wikibase_item)
+            print("claimsToRemove ", claimsToRemove)
+            for claim in claimsToRemove:
+                claims.append({'id': claim.snak, 'remove': ''})
+            newClaims = self.claims_to_add(wikidata_item, wikibase_item, claimsToRemove)
+            print("claimsToAdd ", newClaims)
+            claims.extend(newClaims)
+        if len(claims) > 0:
+            data['claims'] = claims
+        return data
+
+    # an edit too large for the api: the terms, sitelinks and removals first, then the added claims by 20
+    def edit_in_chunks(self, wikibase_item, data):
+        claims = data.pop('claims', [])
+        removals = [claim for claim in claims if 'remove' in claim]
+        if len(removals) > 0:
+            data['claims'] = removals
+        if len(data) > 0:
+            wikibase_item.editEntity(data, summary="Synchronizing the changes in Wikidata")
+        for claimsToAdd in chunks([claim for claim in claims if 'remove' not in claim], 20):
+            wikibase_item.editEntity({'claims': claimsToAdd},
+                                     summary="Adding these statements since they where added in Wikidata")
+
+    # True if the entity was already synchronized from its current wikidata revision
+    def unchanged(self, wikidata_item, statements):
+        if self.revisions is None or not self.id.contains_id(wikidata_item.getID()):
+            return False
+        if self.revisions.is_synced(wikidata_item.getID(), wikidata_item.latest_revision_id, statements):
+            print("Entity ", wikidata_item.getID(), " did not change since the last sync")
+            return True
+        return False
+
+    def synced(self, wikidata_item, statements):
+        if self.revisions is not None:
+            self.revisions.synced(wikidata_item.getID(), wikidata_item.latest_revision_id, statements)
+
+    # the revision is only recorded as synced if all the changes were saved; the entities whose changes were not all
+    # saved are remembered until a later sync saves them, see sync_failed
+    def sync_done(self, wikidata_item, statements, saved):
+        with self.failures_lock:
+            if saved:
+                self.failures.discard(wikidata_item.getID())
+            else:
+                self.failures.add(wikidata_item.getID())
+        if saved:
+            self.synced(wikidata_item, statements)
+        else:
+            print("Some changes of ", wikidata_item.getID(), " could not be saved, it will be synced again")
+
+    # True if the last sync of the entity could not save all its changes
+    def sync_failed(self, id):
+        with self.failures_lock:
+            return id in self.failures
+
+    # the given wikidata ids without the ones that did not change since their last sync, with one request every 50 ids
+    def changed_ids(self, ids, statements=True):
+        if self.revisions is None:
+            return list(ids)
+        return self.revisions.changed(self.wikidata_repo, list(ids), statements)
+
+    # wikibase_item is the page of the corresponding wikibase item when it was already fetched, e.g. with the batch
+    def change_item(self, wikidata_item, wikibase_repo, statements, wikibase_item=None):
         try:
             item = wikidata_item.get()
         except pywikibot.exceptions.UnknownSite as e:
             print("There is a problem fetching an entity, this should ideally not occur")
             return
-        print("Change Entity ", wikidata_item.getID())
-        if not self.id.contains_id(wikidata_item.getID()):
-            new_id = self.importItem(wikidata_item)
-            wikibase_item = pywikibot.ItemPage(wikibase_repo, new_id)
-            wikibase_item.get()
-        else:
-            print("This entity corresponds to ", self.id.get_id(wikidata_item.getID()))
-            wikibase_item = pywikibot.ItemPage(wikibase_repo, self.id.get_id(wikidata_item.getID()))
-            wikibase_item.get()
-            self.changeLabels(wikidata_item, wikibase_item)
-            self.changeAliases(wikidata_item, wikibase_item)
-            self.change_descriptions(wikidata_item, wikibase_item)
-            self.wikidata_link(wikibase_item, wikidata_item)
-        if statements:
-            self.changeSiteLinks(wikidata_item, wikibase_item)
-            self.changeClaims(wikidata_item, wikibase_item)
-        return wikibase_item
+        with self.locks.hold(wikidata_item.getID()) as acquired:
+            if not acquired:
+                # another worker is changing this entity, here it is enough that it exists
+                print("Entity ", wikidata_item.getID(), " is changed by another worker")
+                if not self.id.contains_id(wikidata_item.getID()):
+                    self.importItem(wikidata_item)
+                wikibase_item = pywikibot.ItemPage(wikibase_repo, self.id.get_id(wikidata_item.getID()))
+                wikibase_item.get()
+                return wikibase_item
+            if self.unchanged(wikidata_item, statements):
+                return pywikibot.ItemPage(wikibase_repo, self.id.get_id(wikidata_item.getID()))
+            print("Change Entity ", wikidata_item.getID())
+            if not self.id.contains_id(wikidata_item.getID()):
+                new_id = self.importItem(wikidata_item)
+                wikibase_item = pywikibot.ItemPage(wikibase_repo, new_id)
+                wikibase_item.get()
+                # the import sets the terms and the link
+                terms = False
+            else:
+                print("This entity corresponds to ", self.id.get_id(wikidata_item.getID()))
+                if self.single_edit and self.engine == 'json':
+                    saved = self.change_entity_json(wikidata_item, self.id.get_id(wikidata_item.getID()), True,
+                                                    statements, getattr(wikibase_item, '_content', None))
+                    if saved is not None:
+                        self.sync_done(wikidata_item, statements, saved)
+                        return pywikibot.ItemPage(wikibase_repo, self.id.get_id(wikidata_item.getID()))
+                if wikibase_item is None:
+                    wikibase_item = pywikibot.ItemPage(wikibase_repo, self.id.get_id(wikidata_item.getID()))
+                    wikibase_item.get()
+                terms = True
+            saved = self.change_entity(wikidata_item, wikibase_item, terms, statements)
+            self.sync_done(wikidata_item, statements, saved)
+            return wikibase_item
 
     def change_item_given_id(self, wikidata_item, id, wikibase_repo, statements):
-        print("This entity corresponds to ", id)
-        wikibase_item = pywikibot.ItemPage(wikibase_repo, id)
-        wikibase_item.get()
-        self.changeLabels(wikidata_item, wikibase_item)
-        self.changeAliases(wikidata_item, wikibase_item)
-        self.change_descriptions(wikidata_item, wikibase_item)
-        self.wikidata_link(wikibase_item, wikidata_item)
-        if statements:
-            self.changeSiteLinks(wikidata_item, wikibase_item)
-            self.changeClaims(wikidata_item, wikibase_item)
+        with self.locks.hold(wikidata_item.getID()) as acquired:
+            if not acquired:
+                # another worker is changing this entity
+                print("Entity ", wikidata_item.getID(), " is changed by another worker")
+                return pywikibot.ItemPage(wikibase_repo, id)
+            print("This entity corresponds to ", id)
+            wikibase_item = pywikibot.ItemPage(wikibase_repo, id)
+            wikibase_item.get()
+            saved = self.change_entity(wikidata_item, wikibase_item, True, statements)
+            self.sync_done(wikidata_item, statements, saved)
+            return wikibase_item
 
 
     def change_property(self, wikidata_item, wikibase_repo, statements):
         print("Change Property", wikidata_item.getID())
         wikidata_item.get()
-        wikibase_item = None
-        if not self.id.contains_id(wikidata_item.getID()):
-            new_id = self.importProperty(wikidata_item)
-        else:
-            print("Entering here")
-            wikibase_item = pywikibot.PropertyPage(wikibase_repo, self.id.get_id(wikidata_item.getID()),
-                                                   datatype=wikidata_item.type)
-            wikibase_item.get()
-            new_id = wikibase_item.getID()
-            self.changeLabels(wikidata_item, wikibase_item)
-            self.changeAliases(wikidata_item, wikibase_item)
-            self.change_descriptions(wikidata_item, wikibase_item)
-        if statements:
-            self.changeClaims(wikidata_item, wikibase_item)
-        return wikibase_item
+        with self.locks.hold(wikidata_item.getID()) as acquired:
+            if not acquired:
+                # another worker is changing this property, here it is enough that it exists
+                print("Entity ", wikidata_item.getID(), " is changed by another worker")
+                if not self.id.contains_id(wikidata_item.getID()):
+                    self.importProperty(wikidata_item)
+                return pywikibot.PropertyPage(wikibase_repo, self.id.get_id(wikidata_item.getID()),
+                                              datatype=wikidata_item.type)
+            wikibase_item = None
+            if self.unchanged(wikidata_item, statements):
+                return pywikibot.PropertyPage(wikibase_repo, self.id.get_id(wikidata_item.getID()),
+                                              datatype=wikidata_item.type)
+            if not self.id.contains_id(wikidata_item.getID()):
+                new_id = self.importProperty(wikidata_item)
+                if new_id is None:
+                    self.sync_done(wikidata_item, statements, False)
+                    return None
+                # the new property has the terms already, its statements are added
+                wikibase_item = pywikibot.PropertyPage(wikibase_repo, new_id, datatype=wikidata_item.type)
+                wikibase_item.get()
+                saved = self.change_entity(wikidata_item, wikibase_item, False, statements)
+            else:
+                wikibase_item = pywikibot.PropertyPage(wikibase_repo, self.id.get_id(wikidata_item.getID()),
+                                                       datatype=wikidata_item.type)
+                wikibase_item.get()
+                new_id = wikibase_item.getID()
+                saved = self.change_entity(wikidata_item, wikibase_item, True, statements)
+            self.sync_done(wikidata_item, statements, saved)
+            return wikibase_item
+
 
 
 